@@ -9,7 +9,7 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+from data_api.async_utils import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "dag.settings")
 
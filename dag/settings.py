@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -76,12 +77,53 @@ WSGI_APPLICATION = "dag.wsgi.application"
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
+# Set from the environment: DAG_DB_ENGINE is "sqlite" (default) or "postgresql",
+# DAG_DB_NAME, DAG_DB_USER, DAG_DB_PASSWORD, DAG_DB_HOST and DAG_DB_PORT locate it.
+# Connections are kept open DAG_DB_CONN_MAX_AGE seconds, and checked before a
+# request reuses them unless DAG_DB_CONN_HEALTH_CHECKS is false
+
+DB_ENGINE = os.environ.get("DAG_DB_ENGINE", "sqlite")
+
+if DB_ENGINE == "postgresql":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("DAG_DB_NAME", "dag"),
+            "USER": os.environ.get("DAG_DB_USER", "dag"),
+            "PASSWORD": os.environ.get("DAG_DB_PASSWORD", ""),
+            "HOST": os.environ.get("DAG_DB_HOST", "localhost"),
+            "PORT": os.environ.get("DAG_DB_PORT", "5432"),
+        }
+    }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.environ.get("DAG_DB_NAME", BASE_DIR / "db.sqlite3"),
+        }
+    }
+
+DATABASES["default"]["CONN_MAX_AGE"] = int(os.environ.get("DAG_DB_CONN_MAX_AGE", 60))
+DATABASES["default"]["CONN_HEALTH_CHECKS"] = os.environ.get(
+    "DAG_DB_CONN_HEALTH_CHECKS", "true"
+).lower() in ("true", "1")
 
-DATABASES = {
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+CACHES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
-    }
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # dataset dumps, evicted least recently used first once they take more than
+    # MAX_SIZE bytes, the memory bound of the dump cache per process
+    "dumps": {
+        "BACKEND": "data_api.cache_utils.SizedLocMemCache",
+        "LOCATION": "dataset-dumps",
+        "TIMEOUT": None,
+        "OPTIONS": {"MAX_ENTRIES": 32, "MAX_SIZE": 64 * 1024 * 1024},
+    },
 }
 
 
@@ -127,3 +169,82 @@ STATIC_URL = "/static/"
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+
+# Data API
+# Number of rows written per INSERT by the bulk endpoints
+
+DATA_API_BULK_BATCH_SIZE = 1000
+
+DATA_API_BULK_MAX_BATCH_SIZE = 10000
+
+# Maximum number of rejected lines reported back by a streaming NDJSON ingest
+
+DATA_API_INGEST_MAX_REPORTED_ERRORS = 1000
+
+# Default and maximum number of items returned by one page of a list endpoint
+
+DATA_API_PAGE_SIZE = 100
+
+DATA_API_MAX_PAGE_SIZE = 1000
+
+# Number of resources fetched per database round trip when dumping a dataset
+
+DATA_API_DUMP_CHUNK_SIZE = 2000
+
+# Cache used for dataset dumps, and the size in bytes above which a dump is not cached
+
+DATA_API_DUMP_CACHE = "dumps"
+
+DATA_API_DUMP_CACHE_MAX_SIZE = 16 * 1024 * 1024
+
+# Background dump jobs: number of worker threads, directory of the built files,
+# seconds a finished job is kept, and seconds after which a job that is still
+# pending or running is failed, e.g. when the process running it stopped
+
+DATA_API_DUMP_JOB_WORKERS = 2
+
+DATA_API_DUMP_JOB_DIR = BASE_DIR / "dump_jobs"
+
+DATA_API_DUMP_JOB_TTL = 3600
+
+DATA_API_DUMP_JOB_TIMEOUT = 6 * 3600
+
+# Cache used for aggregations, and the maximum number of groups an aggregation returns
+
+DATA_API_AGGREGATE_CACHE = "default"
+
+DATA_API_AGGREGATE_MAX_GROUPS = 10000
+
+# Insert the resources created by concurrent requests together: a writer thread
+# takes the creates queued within DATA_API_WRITE_BATCH_WAIT milliseconds, up to
+# DATA_API_WRITE_BATCH_SIZE, and writes them in one transaction. A create the writer
+# has not taken within DATA_API_WRITE_TIMEOUT seconds is written by its request
+
+DATA_API_COALESCE_WRITES = False
+
+DATA_API_WRITE_BATCH_SIZE = 500
+
+DATA_API_WRITE_BATCH_WAIT = 2
+
+DATA_API_WRITE_TIMEOUT = 10
+
+# Dotted path of the function encoding the json responses to bytes, orjson is
+# used by default if it is installed
+
+DATA_API_JSON_SERIALIZER = None
+
+# PRAGMAs run on every new SQLite connection: WAL lets readers run during a write,
+# busy_timeout (ms) makes writers wait for the lock instead of failing. Set
+# DAG_DB_SQLITE_WAL to false to keep the SQLite defaults
+
+DATA_API_SQLITE_PRAGMAS = (
+    {
+        "journal_mode": "wal",
+        "synchronous": "normal",
+        "busy_timeout": 5000,
+        "mmap_size": 256 * 1024 * 1024,
+    }
+    if os.environ.get("DAG_DB_SQLITE_WAL", "true").lower() in ("true", "1")
+    else {}
+)
@@ -0,0 +1,214 @@
+import datetime
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import (
+    Avg,
+    BigIntegerField,
+    BooleanField,
+    Count,
+    DateField,
+    FloatField,
+    Max,
+    Min,
+    Sum,
+)
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.functions import Cast, TruncDay, TruncMonth, TruncWeek, TruncYear
+
+from .filter_utils import get_property_type
+
+AGGREGATE_FUNCTIONS = {"count": Count, "sum": Sum, "min": Min, "max": Max, "avg": Avg}
+BUCKETS = {"day": TruncDay, "week": TruncWeek, "month": TruncMonth, "year": TruncYear}
+# jsonschema types that can be grouped by, and the fields their values are cast to
+GROUP_TYPES = {
+    "string": None,
+    "integer": BigIntegerField,
+    "number": FloatField,
+    "boolean": BooleanField,
+}
+NUMERIC_TYPES = ("integer", "number")
+# query string parameters of an aggregation, the others are filters
+AGGREGATION_PARAMETERS = ("group_by", "metrics", "bucket")
+
+
+def split_parameter(query, parameter):
+    return [item for item in query.get(parameter, "").split(",") if item]
+
+
+def get_filter_query(query):
+    """
+    Return the query string of an aggregation without the aggregation parameters,
+    to be parsed by `parse_resource_filters`.
+    """
+    filter_query = query.copy()
+    for parameter in AGGREGATION_PARAMETERS:
+        filter_query.pop(parameter, None)
+    return filter_query
+
+
+def parse_aggregation(query, resource_schema):
+    """
+    Parse the query string of an aggregation, checked against the resource schema:
+    - `group_by`, comma separated properties to group the resources by
+    - `metrics`, comma separated `<function>:<property>` with function one of
+      count, sum, min, max, avg on numeric properties, or `count` alone for the
+      number of resources. Default to `count`
+    - `bucket`, comma separated `<property>:<day|week|month|year>`, groups a date
+      property of group_by by the start of its day, week, month or year
+    Return (group by properties, metrics, buckets), raise ValueError if invalid.
+    """
+    properties = resource_schema.get("properties", {})
+
+    def get_type(property_name):
+        if property_name not in properties:
+            raise ValueError(
+                f"Unknown property {property_name}. Supported properties: {list(properties)}"
+            )
+        return get_property_type(properties[property_name])
+
+    group_by = split_parameter(query, "group_by")
+    for property_name in group_by:
+        if get_type(property_name) not in GROUP_TYPES:
+            raise ValueError(f"Cannot group by {property_name}, it is not a scalar")
+
+    metrics = []
+    for metric in split_parameter(query, "metrics") or ["count"]:
+        function, _, property_name = metric.partition(":")
+        if function not in AGGREGATE_FUNCTIONS:
+            raise ValueError(
+                f"Unknown function {function}. Supported functions: {list(AGGREGATE_FUNCTIONS)}"
+            )
+        if property_name and function != "count":
+            if get_type(property_name) not in NUMERIC_TYPES:
+                raise ValueError(
+                    f"Cannot {function} {property_name}, it is not numeric"
+                )
+        elif property_name:
+            get_type(property_name)
+        elif function != "count":
+            raise ValueError(f"{function} needs a property, {function}:<property>")
+        metrics.append((function, property_name or None))
+
+    buckets = {}
+    for bucket in split_parameter(query, "bucket"):
+        property_name, _, unit = bucket.partition(":")
+        if property_name not in group_by or get_type(property_name) != "string":
+            raise ValueError(f"Cannot bucket {property_name}, group by a date property")
+        if unit not in BUCKETS:
+            raise ValueError(
+                f"Unknown bucket {unit}. Supported buckets: {list(BUCKETS)}"
+            )
+        buckets[property_name] = unit
+
+    return group_by, metrics, buckets
+
+
+def get_property_expression(property_name, property_type):
+    """
+    Return the expression extracting a property of the resource values, cast to
+    the sql type of its jsonschema type.
+    """
+    expression = KeyTextTransform(property_name, "value")
+    field_class = GROUP_TYPES.get(property_type)
+    return expression if field_class is None else Cast(expression, field_class())
+
+
+def get_metric_name(function, property_name):
+    return function if property_name is None else f"{function}_{property_name}"
+
+
+def to_json_value(value):
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return value
+
+
+def aggregate_resources(resources, resource_schema, group_by, metrics, buckets):
+    """
+    Aggregate a resource queryset, see `parse_aggregation`, with a single
+    GROUP BY over the extracted properties, so only the groups leave the database.
+    Return a list of {"group": {property: value}, "metrics": {name: value}}
+    ordered by group, raise ValueError if there are more groups than
+    DATA_API_AGGREGATE_MAX_GROUPS.
+    """
+    properties = resource_schema.get("properties", {})
+
+    def get_expression(property_name):
+        return get_property_expression(
+            property_name, get_property_type(properties[property_name])
+        )
+
+    groups = {}
+    for index, property_name in enumerate(group_by):
+        if property_name in buckets:
+            date = Cast(KeyTextTransform(property_name, "value"), DateField())
+            groups[f"group_{index}"] = BUCKETS[buckets[property_name]](date)
+        else:
+            groups[f"group_{index}"] = get_expression(property_name)
+
+    aggregates = {}
+    for index, (function, property_name) in enumerate(metrics):
+        if property_name is None:
+            aggregate = Count("id")
+        elif function == "avg":
+            aggregate = Avg(get_expression(property_name), output_field=FloatField())
+        else:
+            aggregate = AGGREGATE_FUNCTIONS[function](get_expression(property_name))
+        aggregates[f"metric_{index}"] = aggregate
+
+    if not groups:
+        rows = [resources.aggregate(**aggregates)]
+    else:
+        max_groups = getattr(settings, "DATA_API_AGGREGATE_MAX_GROUPS", 10000)
+        rows = list(
+            resources.annotate(**groups)
+            .values(*groups)
+            .annotate(**aggregates)
+            .order_by(*groups)[: max_groups + 1]
+        )
+        if len(rows) > max_groups:
+            raise ValueError(f"More than {max_groups} groups, narrow the aggregation")
+
+    return [
+        {
+            "group": {
+                property_name: to_json_value(row[f"group_{index}"])
+                for index, property_name in enumerate(group_by)
+            },
+            "metrics": {
+                get_metric_name(function, property_name): row[f"metric_{index}"]
+                for index, (function, property_name) in enumerate(metrics)
+            },
+        }
+        for row in rows
+    ]
+
+
+def get_aggregate_version(dataset, resource_type, query):
+    """
+    Return the version of an aggregation, used both as the cache key and ETag.
+    `dataset` must be annotated with the `schema_version` of its app.
+    """
+    digest = hashlib.md5(json.dumps(sorted(query.lists())).encode()).hexdigest()
+    return (
+        f"{dataset.id}-{dataset.version}-{dataset.schema_version}-"
+        f"{resource_type}-{digest}"
+    )
+
+
+def get_aggregate_cache():
+    return caches[getattr(settings, "DATA_API_AGGREGATE_CACHE", "default")]
+
+
+def get_cached_aggregate(aggregate_version):
+    """
+    Return the cached payload of an aggregation, or None.
+    """
+    return get_aggregate_cache().get(f"dataset-aggregate:{aggregate_version}")
+
+
+def cache_aggregate(aggregate_version, payload):
+    get_aggregate_cache().set(f"dataset-aggregate:{aggregate_version}", payload)
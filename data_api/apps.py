@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class DataApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "data_api"
+
+    def ready(self):
+        # register the signal receivers
+        from . import signals  # noqa: F401
@@ -0,0 +1,61 @@
+import django
+from asgiref.sync import sync_to_async
+from django.core.handlers import asgi
+
+
+def get_response_headers(response):
+    """
+    Return the headers and cookies of a response as a list of ASGI header pairs.
+    """
+    response_headers = []
+    for header, value in response.items():
+        if isinstance(header, str):
+            header = header.encode("ascii")
+        if isinstance(value, str):
+            value = value.encode("latin1")
+        response_headers.append((bytes(header), bytes(value)))
+    for cookie in response.cookies.values():
+        response_headers.append(
+            (b"Set-Cookie", cookie.output(header="").encode("ascii").strip())
+        )
+    return response_headers
+
+
+class ASGIHandler(asgi.ASGIHandler):
+    """
+    Django's ASGI handler, with the streaming responses, the dumps, iterated in the
+    thread of the sync views one part at a time. Django 3.2 iterates them on the
+    event loop, where their queries are refused.
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": get_response_headers(response),
+            }
+        )
+        parts = iter(response)
+        next_part = sync_to_async(next, thread_sensitive=True)
+        while True:
+            part = await next_part(parts, None)
+            if part is None:
+                break
+            for chunk, _ in self.chunk_bytes(part):
+                await send(
+                    {"type": "http.response.body", "body": chunk, "more_body": True}
+                )
+        await send({"type": "http.response.body"})
+        await sync_to_async(response.close, thread_sensitive=True)()
+
+
+def get_asgi_application():
+    """
+    Same as django.core.asgi.get_asgi_application, with the handler above.
+    """
+    django.setup(set_prefix=False)
+    return ASGIHandler()
@@ -0,0 +1,28 @@
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+
+
+class SizedLocMemCache(LocMemCache):
+    """
+    LocMemCache bounded by the total size of its pickled values, the MAX_SIZE
+    option in bytes, on top of MAX_ENTRIES. The least recently used entries are
+    evicted first, values bigger than MAX_SIZE are not cached.
+    """
+
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        self._max_size = int(params.get("OPTIONS", {}).get("MAX_SIZE", 0))
+
+    def _set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        # called with the lock held. The store is shared by the cache instances
+        # of all the threads, so its size is summed from the store itself
+        self._delete(key)
+        if len(value) > self._max_size:
+            return
+        size = len(value) + sum(len(pickled) for pickled in self._cache.values())
+        while size > self._max_size:
+            # the least recently used entry is the last one
+            evicted_key, pickled = self._cache.popitem()
+            del self._expire_info[evicted_key]
+            size -= len(pickled)
+        super()._set(key, value, timeout)
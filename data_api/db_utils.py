@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.db import connections
+
+
+def configure_sqlite_connection(connection):
+    """
+    Run the DATA_API_SQLITE_PRAGMAS on a new SQLite connection, e.g. WAL mode
+    so readers do not wait for a writer, and a busy timeout so writers wait for
+    the lock instead of failing with "database is locked".
+    """
+    if connection.vendor != "sqlite":
+        return
+    pragmas = getattr(settings, "DATA_API_SQLITE_PRAGMAS", {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def close_unusable_connections():
+    """
+    Close the persistent connections that cannot be used anymore, e.g. after a
+    database restart, so the request opens new ones instead of failing.
+    Only the connections with CONN_HEALTH_CHECKS set are checked, the same
+    setting as Django 4.1 which does this natively.
+    """
+    for connection in connections.all():
+        if (
+            connection.connection is not None
+            and connection.settings_dict.get("CONN_HEALTH_CHECKS")
+            and not connection.is_usable()
+        ):
+            connection.close()
@@ -0,0 +1,138 @@
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q, Subquery
+
+from .filter_utils import ValueKeyTransform
+from .json_utils import dumps
+from .models import Resource
+
+ADDED = "added"
+REMOVED = "removed"
+CHANGED = "changed"
+
+
+def get_diff_resource_types(dataset_id, base_id):
+    """
+    Return the resource types found in either dataset, ordered.
+    """
+    return list(
+        Resource.objects.filter(dataset__in=[dataset_id, base_id])
+        .order_by("resource_type")
+        .values_list("resource_type", flat=True)
+        .distinct()
+    )
+
+
+def diff_keyed_resources(dataset_id, base_id, resource_type, key, chunk_size):
+    """
+    Yield the resources of a type with a key (`x-key`) added to, removed from or
+    changed in a dataset compared to a base dataset, matched by key.
+    Added and removed resources are found with NOT EXISTS anti-joins on the
+    extracted key, served by the unique key index, and changed ones by comparing
+    the values of the resources with the same key, all in the database.
+    """
+    aliases = {f"key_{index}": name for index, name in enumerate(key)}
+
+    def get_resources(dataset):
+        return Resource.objects.filter(
+            dataset=dataset, resource_type=resource_type
+        ).alias(**{alias: ValueKeyTransform(name) for alias, name in aliases.items()})
+
+    def same_key(dataset):
+        # the resources of a dataset with the same key as the outer resource
+        return get_resources(dataset).filter(
+            **{alias: OuterRef(alias) for alias in aliases}
+        )
+
+    def to_json(op, row, **extra):
+        return {
+            "op": op,
+            "resource_type": resource_type,
+            "key": {name: row["value"].get(name) for name in key},
+            "id": row["id"],
+            "value": row["value"],
+            **extra,
+        }
+
+    added = get_resources(dataset_id).filter(~Exists(same_key(base_id)))
+    for row in added.order_by("id").values("id", "value").iterator(chunk_size):
+        yield to_json(ADDED, row)
+
+    removed = get_resources(base_id).filter(~Exists(same_key(dataset_id)))
+    for row in removed.order_by("id").values("id", "value").iterator(chunk_size):
+        yield to_json(REMOVED, row)
+
+    # stored values are compared as they are, json text on SQLite and jsonb on
+    # PostgreSQL
+    changed_base = same_key(base_id).filter(~Q(value=OuterRef("value")))
+    changed = (
+        get_resources(dataset_id)
+        .filter(Exists(changed_base))
+        .annotate(
+            base_id=Subquery(changed_base.values("id")[:1]),
+            base_value=Subquery(changed_base.values("value")[:1]),
+        )
+    )
+    rows = changed.order_by("id").values("id", "value", "base_id", "base_value")
+    for row in rows.iterator(chunk_size):
+        yield to_json(
+            CHANGED, row, base_id=row["base_id"], base_value=row["base_value"]
+        )
+
+
+def diff_resources_by_value(dataset_id, base_id, resource_type, chunk_size):
+    """
+    Yield the values of a resource type without key added to or removed from a
+    dataset compared to a base dataset, with EXCEPT queries in the database.
+    Resources have no identity across datasets without a key (copies get new ids),
+    so a changed resource is reported as removed and added, and repeated values
+    are reported once.
+    """
+    for op, left, right in (
+        (ADDED, dataset_id, base_id),
+        (REMOVED, base_id, dataset_id),
+    ):
+        values = (
+            Resource.objects.filter(dataset=left, resource_type=resource_type)
+            .values_list("value", flat=True)
+            .difference(
+                Resource.objects.filter(
+                    dataset=right, resource_type=resource_type
+                ).values_list("value", flat=True)
+            )
+        )
+        for value in values.iterator(chunk_size):
+            yield {"op": op, "resource_type": resource_type, "value": value}
+
+
+def stream_diff(
+    dataset_id, base_id, key_properties, resource_types=None, chunk_size=None
+):
+    """
+    Generate the difference between a dataset and a base dataset as NDJSON,
+    one line per added, removed or changed resource, resource type by resource type.
+    Resources are matched by key if their resource type declares one, see
+    `get_key_properties` and `diff_keyed_resources`, and by value otherwise.
+    """
+    if chunk_size is None:
+        chunk_size = getattr(settings, "DATA_API_DUMP_CHUNK_SIZE", 2000)
+    if resource_types is None:
+        resource_types = get_diff_resource_types(dataset_id, base_id)
+
+    lines = []
+    for resource_type in resource_types:
+        key = key_properties.get(resource_type)
+        if key is not None:
+            changes = diff_keyed_resources(
+                dataset_id, base_id, resource_type, key, chunk_size
+            )
+        else:
+            changes = diff_resources_by_value(
+                dataset_id, base_id, resource_type, chunk_size
+            )
+        for change in changes:
+            lines.append(dumps(change))
+            if len(lines) >= chunk_size:
+                yield b"\n".join(lines) + b"\n"
+                lines = []
+    if lines:
+        yield b"\n".join(lines) + b"\n"
@@ -1,63 +1,390 @@
-from io import BytesIO
+import csv
+import io
+import json
+import tempfile
+import zipfile
 
+from django.conf import settings
+from django.core.cache import caches
 from openpyxl import Workbook
 
+from .filter_utils import get_property_type
+from .json_utils import raw_json
 from .models import Dataset, Resource
 
 
-def dump_to_json(dataset_id):
+def stream_dump_to_json(dataset_id, chunk_size=None, progress=None):
     """
-    Convert all the resources under a dataset to json format.
+    Convert all the resources under a dataset to json format, an object mapping
+    each resource type to the list of its resource values, generated piece by piece.
+    The resources are walked in (resource_type, id) order with a chunked iterator,
+    so only one chunk of resources is held in memory at a time. The values are
+    written as the json text stored in the database, see `raw_json`.
+    `progress(resource_type, rows)` is called with the number of rows written so far
+    for a resource type, once per chunk and once the resource type is done.
     """
-    dataset = Dataset.objects.get(id=dataset_id)
-    resources = dataset.resources.all()
+    if chunk_size is None:
+        chunk_size = getattr(settings, "DATA_API_DUMP_CHUNK_SIZE", 2000)
+    resources = (
+        Dataset.objects.get(id=dataset_id)
+        .resources.order_by("resource_type", "id")
+        .values_list("resource_type", raw_json("value"))
+        .iterator(chunk_size=chunk_size)
+    )
 
-    # group the resources by resource type
-    grouped_resources = {}
-    for resource in resources:
-        if resource.resource_type not in grouped_resources:
-            grouped_resources[resource.resource_type] = []
-        grouped_resources[resource.resource_type].append(resource.value)
+    current_resource_type = None
+    rows = 0
+    parts = ["{"]
+    for resource_type, value in resources:
+        if resource_type != current_resource_type:
+            # close the previous resource type list and open a new one
+            if current_resource_type is not None:
+                parts.append("],")
+                if progress is not None:
+                    progress(current_resource_type, rows)
+            parts.append(f"{json.dumps(resource_type)}:[")
+            current_resource_type = resource_type
+            rows = 0
+        else:
+            parts.append(",")
+        parts.append(value)
+        rows += 1
 
-    return grouped_resources
+        if len(parts) >= chunk_size:
+            yield "".join(parts).encode()
+            parts = []
+            if progress is not None:
+                progress(current_resource_type, rows)
 
+    if current_resource_type is not None:
+        parts.append("]")
+        if progress is not None:
+            progress(current_resource_type, rows)
+    parts.append("}")
+    yield "".join(parts).encode()
 
-def dump_to_excel(dataset_id):
+
+def iter_resource_types(dataset_id, chunk_size):
+    """
+    Yield (resource type, schema, chunked iterator over the values) for each
+    resource type of a dataset, ordered by resource type.
+    """
+    dataset = Dataset.objects.select_related("app").get(id=dataset_id)
+    schemas = {schema["title"].lower(): schema for schema in dataset.app.schemas}
+    resource_types = (
+        dataset.resources.order_by("resource_type")
+        .values_list("resource_type", flat=True)
+        .distinct()
+    )
+    for resource_type in resource_types:
+        values = (
+            dataset.resources.filter(resource_type=resource_type)
+            .order_by("id")
+            .values_list("value", flat=True)
+            .iterator(chunk_size=chunk_size)
+        )
+        yield resource_type, schemas.get(resource_type), values
+
+
+def get_resource_header(schema, first_record):
+    """
+    Return the header of a resource type sheet or csv file.
+    The header is taken from the schema properties, or from the first record keys
+    if the resource type is not declared in the schemas.
+    """
+    if schema is not None and schema.get("properties"):
+        return list(schema["properties"].keys())
+    return list(first_record.keys())
+
+
+def to_cell(value):
+    """
+    Convert a resource property to a value that can be written in a cell or csv field.
+    Objects and arrays are written as json.
+    """
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+def dump_to_excel(dataset_id, chunk_size=None, output=None, progress=None):
     """
     Convert all the resources under a dataset to an excel spreadsheet.
     With each resource type has its own sheet.
     All the resource records under one resource type correspond to rows under the sheet.
-    """
-    dataset = Dataset.objects.get(id=dataset_id)
-    resources = dataset.resources.all()
 
-    # group the resources by resource type
-    grouped_resources = {}
-    for resource in resources:
-        if resource.resource_type not in grouped_resources:
-            grouped_resources[resource.resource_type] = []
-        grouped_resources[resource.resource_type].append(resource.value)
+    The workbook is written in write-only mode, sheet by sheet, from a chunked
+    iterator over the resources, to `output` or to a temporary file.
+    `progress(resource_type, rows)` is called with the number of rows written so far
+    to a sheet, once per chunk and once the sheet is done.
+    Return the file, positioned at its start.
+    """
+    if chunk_size is None:
+        chunk_size = getattr(settings, "DATA_API_DUMP_CHUNK_SIZE", 2000)
 
-    # convert the grouped resources to excel
-    workbook = Workbook()
-    for resource_type in grouped_resources:
-        # create a new sheet
+    workbook = Workbook(write_only=True)
+    for resource_type, schema, records in iter_resource_types(dataset_id, chunk_size):
         sheet = workbook.create_sheet(resource_type)
-        # get the resource records
-        resource_records = grouped_resources[resource_type]
-        # write the header
-        header = list(resource_records[0].keys())
-        sheet.append(header)
-        # write the records
-        for record in resource_records:
-            sheet.append(list(record.values()))
-
-    # delete the default sheet
-    workbook.remove(workbook["Sheet"])
-
-    # write the workbook to a byteio
-    byte_io = BytesIO()
-    workbook.save(byte_io)
-    byte_io.seek(0)
-
-    return byte_io
+        header = None
+        rows = 0
+        for record in records:
+            if header is None:
+                header = get_resource_header(schema, record)
+                sheet.append(header)
+            sheet.append([to_cell(record.get(column)) for column in header])
+            rows += 1
+            if progress is not None and rows % chunk_size == 0:
+                progress(resource_type, rows)
+        if progress is not None:
+            progress(resource_type, rows)
+
+    # write the workbook to a temporary file by default, removed once closed
+    excel_file = output if output is not None else tempfile.TemporaryFile()
+    workbook.save(excel_file)
+    excel_file.seek(0)
+
+    return excel_file
+
+
+# content type and file extension of each dump type
+DUMP_CONTENT_TYPES = {
+    "json": "application/json",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "application/zip",
+    "parquet": "application/zip",
+}
+DUMP_FILE_EXTENSIONS = {"json": "json", "xlsx": "xlsx", "csv": "zip", "parquet": "zip"}
+
+
+class ZipStream(io.RawIOBase):
+    """
+    Write-only, unseekable file that keeps what is written until it is popped,
+    so a zip archive can be streamed while it is written.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_dump_to_csv(dataset_id, chunk_size=None, progress=None):
+    """
+    Convert all the resources under a dataset to a zip archive of csv files,
+    one csv per resource type with a header row, generated piece by piece.
+    `progress(resource_type, rows)` is called once per chunk and once per file.
+    """
+    if chunk_size is None:
+        chunk_size = getattr(settings, "DATA_API_DUMP_CHUNK_SIZE", 2000)
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for resource_type, schema, values in iter_resource_types(
+            dataset_id, chunk_size
+        ):
+            entry = archive.open(f"{resource_type}.csv", "w", force_zip64=True)
+            with io.TextIOWrapper(entry, encoding="utf-8", newline="") as csv_file:
+                writer = csv.writer(csv_file)
+                header = None
+                rows = 0
+                for value in values:
+                    if header is None:
+                        header = get_resource_header(schema, value)
+                        writer.writerow(header)
+                    writer.writerow([to_cell(value.get(column)) for column in header])
+                    rows += 1
+                    if rows % chunk_size == 0:
+                        csv_file.flush()
+                        yield stream.pop()
+                        if progress is not None:
+                            progress(resource_type, rows)
+            yield stream.pop()
+            if progress is not None:
+                progress(resource_type, rows)
+    yield stream.pop()
+
+
+def get_parquet_schema(pyarrow, schema, first_record):
+    """
+    Return the pyarrow schema of a resource type, with the column types taken from
+    the jsonschema properties. Objects, arrays and the columns of undeclared
+    resource types are stored as strings.
+    """
+    column_types = {
+        "string": pyarrow.string(),
+        "integer": pyarrow.int64(),
+        "number": pyarrow.float64(),
+        "boolean": pyarrow.bool_(),
+    }
+    if schema is not None and schema.get("properties"):
+        properties = schema["properties"]
+    else:
+        properties = {column: {} for column in first_record}
+    return pyarrow.schema(
+        [
+            (
+                column,
+                column_types.get(get_property_type(property_schema), pyarrow.string()),
+            )
+            for column, property_schema in properties.items()
+        ]
+    )
+
+
+def to_parquet_value(value, is_string):
+    """
+    Convert a resource property to a value of its parquet column.
+    """
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    if is_string and value is not None:
+        return str(value)
+    return value
+
+
+def stream_dump_to_parquet(dataset_id, chunk_size=None, progress=None):
+    """
+    Convert all the resources under a dataset to a zip archive of parquet files,
+    one file per resource type, generated piece by piece. Each chunk of rows is
+    written as a row group to a temporary file, which is then copied to the archive.
+    `progress(resource_type, rows)` is called once per chunk and once per file.
+    Requires pyarrow, raise ImportError right away if it is not installed.
+    """
+    import pyarrow
+    import pyarrow.parquet
+
+    if chunk_size is None:
+        chunk_size = getattr(settings, "DATA_API_DUMP_CHUNK_SIZE", 2000)
+
+    def write_row_group(writer, records):
+        columns = {
+            field.name: [
+                to_parquet_value(record.get(field.name), field.type == pyarrow.string())
+                for record in records
+            ]
+            for field in writer.schema
+        }
+        writer.write_table(pyarrow.Table.from_pydict(columns, schema=writer.schema))
+
+    def write_archive():
+        stream = ZipStream()
+        with zipfile.ZipFile(stream, "w") as archive:
+            for resource_type, schema, values in iter_resource_types(
+                dataset_id, chunk_size
+            ):
+                with tempfile.TemporaryFile() as parquet_file:
+                    writer = None
+                    records = []
+                    rows = 0
+                    for value in values:
+                        if writer is None:
+                            writer = pyarrow.parquet.ParquetWriter(
+                                parquet_file, get_parquet_schema(pyarrow, schema, value)
+                            )
+                        records.append(value)
+                        rows += 1
+                        if len(records) >= chunk_size:
+                            write_row_group(writer, records)
+                            records = []
+                            if progress is not None:
+                                progress(resource_type, rows)
+                    if records:
+                        write_row_group(writer, records)
+                    writer.close()
+
+                    # copy the parquet file to the archive, one piece at a time
+                    parquet_file.seek(0)
+                    with archive.open(
+                        f"{resource_type}.parquet", "w", force_zip64=True
+                    ) as entry:
+                        for data in iter(lambda: parquet_file.read(1024 * 1024), b""):
+                            entry.write(data)
+                            yield stream.pop()
+                yield stream.pop()
+                if progress is not None:
+                    progress(resource_type, rows)
+        yield stream.pop()
+
+    return write_archive()
+
+
+def stream_dump(dataset_id, dump_type, progress=None):
+    """
+    Return the chunks of a dump of one of the streamed types (all but xlsx).
+    """
+    stream_functions = {
+        "json": stream_dump_to_json,
+        "csv": stream_dump_to_csv,
+        "parquet": stream_dump_to_parquet,
+    }
+    return stream_functions[dump_type](dataset_id, progress=progress)
+
+
+def get_dump_version(dataset, dump_type):
+    """
+    Return the version of a dataset dump, used both as the dump cache key and ETag.
+    The xlsx header comes from the app schemas, so the schema version is part of it.
+    `dataset` must be annotated with the `schema_version` of its app.
+    """
+    return f"{dataset.id}-{dataset.version}-{dataset.schema_version}-{dump_type}"
+
+
+def get_dump_cache():
+    return caches[getattr(settings, "DATA_API_DUMP_CACHE", "default")]
+
+
+def get_cached_dump(dump_version):
+    """
+    Return the cached payload of a dataset dump, or None.
+    """
+    return get_dump_cache().get(f"dataset-dump:{dump_version}")
+
+
+def cache_dump(dump_version, payload):
+    """
+    Cache the payload of a dataset dump, unless it is bigger than
+    DATA_API_DUMP_CACHE_MAX_SIZE bytes.
+    """
+    if len(payload) <= getattr(settings, "DATA_API_DUMP_CACHE_MAX_SIZE", 0):
+        get_dump_cache().set(f"dataset-dump:{dump_version}", payload)
+
+
+def stream_and_cache_dump(dump_version, chunks):
+    """
+    Pass the chunks of a streamed dump through, and cache the whole payload once
+    the stream completes. Chunks stop being kept as soon as the payload grows
+    bigger than DATA_API_DUMP_CACHE_MAX_SIZE, so memory stays bounded.
+    """
+    max_size = getattr(settings, "DATA_API_DUMP_CACHE_MAX_SIZE", 0)
+    kept_chunks = []
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        if size > max_size:
+            kept_chunks = None
+        elif kept_chunks is not None:
+            kept_chunks.append(chunk)
+        yield chunk
+    if kept_chunks is not None:
+        cache_dump(dump_version, b"".join(kept_chunks))
+
+
+def cache_dump_file(dump_version, dump_file):
+    """
+    Cache the content of a dump file if it is small enough.
+    The file is left positioned at its start.
+    """
+    size = dump_file.seek(0, 2)
+    dump_file.seek(0)
+    if size <= getattr(settings, "DATA_API_DUMP_CACHE_MAX_SIZE", 0):
+        cache_dump(dump_version, dump_file.read())
+        dump_file.seek(0)
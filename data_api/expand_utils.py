@@ -0,0 +1,81 @@
+import json
+
+from .filter_utils import filter_resources
+from .models import Resource
+
+# types of the referencing values that can be looked up
+REFERENCE_TYPES = (str, int, float, bool)
+
+
+def get_references(resource_schema):
+    """
+    Return the references declared on the properties of a resource schema with
+    `"x-ref": "<resource type>.<property>"`, as property -> (resource type, property).
+    """
+    references = {}
+    for property_name, property_schema in resource_schema.get("properties", {}).items():
+        reference = property_schema.get("x-ref")
+        if isinstance(reference, str) and "." in reference:
+            resource_type, _, referenced_property = reference.partition(".")
+            references[property_name] = (resource_type.lower(), referenced_property)
+    return references
+
+
+def parse_expand(query, resource_schema):
+    """
+    Parse the `expand` query parameter, a comma separated list of properties
+    declaring a reference. Return the references to expand, see `get_references`,
+    raise ValueError if invalid.
+    """
+    references = get_references(resource_schema)
+    expand = {}
+    for property_name in query.get("expand", "").split(","):
+        if not property_name:
+            continue
+        if property_name not in references:
+            raise ValueError(
+                f"Cannot expand {property_name}. Expandable properties: {list(references)}"
+            )
+        expand[property_name] = references[property_name]
+    return expand
+
+
+def expand_resources(resources_json, dataset_id, references):
+    """
+    Add the referenced resources, in json format, under the `expanded` key of
+    resources in json format. Each reference is resolved with a single query for
+    all the resources, an `in` lookup on the referenced property that is served by
+    its key index (`x-key`) or expression index (`x-indexed`) if there is one.
+    A reference matching no resource is expanded to null, one matching several
+    resources to the first one created.
+    """
+    if not references:
+        return resources_json
+
+    for resource_json in resources_json:
+        resource_json["expanded"] = {}
+    for property_name, (resource_type, referenced_property) in references.items():
+        values = {}
+        for resource_json in resources_json:
+            value = resource_json["value"].get(property_name)
+            if isinstance(value, REFERENCE_TYPES):
+                values[json.dumps(value)] = value
+
+        referenced = {}
+        if values:
+            rows = filter_resources(
+                Resource.objects.filter(
+                    dataset=dataset_id, resource_type=resource_type
+                ),
+                [(referenced_property, "in", list(values.values()))],
+            ).order_by("id")
+            for row in rows.values(*Resource.JSON_FIELDS):
+                referenced.setdefault(
+                    json.dumps(row["value"].get(referenced_property)),
+                    Resource.row_to_json(row),
+                )
+
+        for resource_json in resources_json:
+            value = resource_json["value"].get(property_name)
+            resource_json["expanded"][property_name] = referenced.get(json.dumps(value))
+    return resources_json
@@ -0,0 +1,157 @@
+from django.db import connections
+from django.db.models.fields.json import KeyTransform, compile_json_path
+
+# query string parameters that are not filters
+RESERVED_PARAMETERS = {"limit", "cursor", "expand"}
+
+# filter operators supported for each jsonschema type, "exact" has no suffix
+COMPARISON_OPERATORS = ["exact", "in", "gt", "gte", "lt", "lte", "isnull"]
+FILTER_OPERATORS = {
+    "string": COMPARISON_OPERATORS,
+    "integer": COMPARISON_OPERATORS,
+    "number": COMPARISON_OPERATORS,
+    "boolean": ["exact", "in", "isnull"],
+    "object": ["isnull"],
+    "array": ["isnull"],
+}
+
+
+class ValueKeyTransform(KeyTransform):
+    """
+    Extract a top level property of the resource value.
+    Same as the `value__<property>` transform, except that the json path is
+    inlined on SQLite instead of being a query parameter. SQLite only uses an
+    expression index (see `index_utils`) when the expressions match exactly.
+    """
+
+    def __init__(self, property_name):
+        super().__init__(property_name, "value")
+
+    def as_sqlite(self, compiler, connection):
+        lhs, params, key_transforms = self.preprocess_lhs(compiler, connection)
+        json_path = compile_json_path(key_transforms).replace("'", "''")
+        return "JSON_EXTRACT(%s, '%s')" % (lhs, json_path.replace("%", "%%")), params
+
+
+def get_property_type(property_schema):
+    """
+    Return the jsonschema type of a property, the first non null one if several.
+    Untyped properties are filtered as strings.
+    """
+    property_type = property_schema.get("type", "string")
+    if isinstance(property_type, list):
+        property_type = next((t for t in property_type if t != "null"), "string")
+    return property_type
+
+
+def get_filter_operators(property_schema):
+    """
+    Return the filter operators supported by a property.
+    """
+    return FILTER_OPERATORS.get(get_property_type(property_schema), ["isnull"])
+
+
+def parse_boolean(raw_value):
+    if raw_value.lower() in ("true", "1"):
+        return True
+    if raw_value.lower() in ("false", "0"):
+        return False
+    raise ValueError(f"{raw_value} is not a boolean")
+
+
+def coerce_filter_value(property_type, raw_value):
+    """
+    Convert a query string value to the jsonschema type of the property.
+    """
+    if property_type == "integer":
+        return int(raw_value)
+    if property_type == "number":
+        return float(raw_value)
+    if property_type == "boolean":
+        return parse_boolean(raw_value)
+    return raw_value
+
+
+def parse_resource_filters(query, resource_schema):
+    """
+    Parse the query string filters of a list request.
+    A filter is `<property>[__<operator>]=<value>`, where the property must be
+    declared in the resource schema and the operator supported by its type.
+    `in` takes a comma separated list of values.
+    Return a list of (property, operator, value), raise ValueError if invalid.
+    """
+    properties = resource_schema.get("properties", {})
+    filters = []
+    for parameter, raw_values in query.lists():
+        if parameter in RESERVED_PARAMETERS:
+            continue
+        property_name, _, operator = parameter.partition("__")
+        operator = operator or "exact"
+        if property_name not in properties:
+            raise ValueError(
+                f"Cannot filter on {property_name}. Supported properties: {list(properties)}"
+            )
+        property_schema = properties[property_name]
+        if operator not in get_filter_operators(property_schema):
+            raise ValueError(
+                f"Operator {operator} not supported on {property_name}. "
+                f"Supported operators: {get_filter_operators(property_schema)}"
+            )
+
+        property_type = get_property_type(property_schema)
+        raw_value = raw_values[-1]
+        try:
+            if operator == "isnull":
+                value = parse_boolean(raw_value)
+            elif operator == "in":
+                value = [
+                    coerce_filter_value(property_type, v) for v in raw_value.split(",")
+                ]
+            else:
+                value = coerce_filter_value(property_type, raw_value)
+        except ValueError:
+            raise ValueError(f"Invalid value {raw_value} for {parameter}")
+
+        filters.append((property_name, operator, value))
+    return filters
+
+
+def get_btree_properties(resource_schema):
+    """
+    Return the properties of a resource schema served by a btree expression
+    index, the `x-indexed` and `x-key` ones, see `index_utils`.
+    """
+    key = resource_schema.get("x-key") or []
+    properties = set([key] if isinstance(key, str) else key)
+    for property_name, property_schema in resource_schema.get("properties", {}).items():
+        if property_schema.get("x-indexed") is True:
+            properties.add(property_name)
+    return properties
+
+
+def filter_resources(resources, filters, resource_schema=None):
+    """
+    Apply the parsed filters to a resource queryset, as JSONField key lookups
+    on the extracted properties, so the database does the filtering.
+    On PostgreSQL, when the resource schema is given, the exact filters on the
+    properties without a btree index (see `get_btree_properties`) are merged into
+    a single jsonb containment, `value @> {...}`, served by the GIN index over
+    the values instead of scanning the dataset.
+    """
+    if resource_schema is not None and connections[resources.db].vendor == "postgresql":
+        btree_properties = get_btree_properties(resource_schema)
+        contained = {}
+        key_filters = []
+        for property_name, operator, value in filters:
+            if operator == "exact" and property_name not in btree_properties:
+                contained[property_name] = value
+            else:
+                key_filters.append((property_name, operator, value))
+        if contained:
+            resources = resources.filter(value__contains=contained)
+        filters = key_filters
+    for index, (property_name, operator, value) in enumerate(filters):
+        alias = f"value_filter_{index}"
+        resources = resources.alias(**{alias: ValueKeyTransform(property_name)})
+        resources = resources.filter(**{f"{alias}__{operator}": value})
+    return resources
@@ -0,0 +1,223 @@
+import csv
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+
+from django.conf import settings
+from django.db import transaction
+from openpyxl import load_workbook
+
+from .filter_utils import coerce_filter_value, get_property_type
+from .ingest_utils import delete_resources, insert_resources, validate_values
+from .models import Resource
+
+IMPORT_TYPES = ("xlsx", "csv")
+APPEND = "append"
+REPLACE = "replace"
+IMPORT_MODES = (APPEND, REPLACE)
+
+
+def get_import_params(request):
+    """
+    Return the import type and mode, taken from the `type` and `mode` query parameters.
+    """
+    import_type = request.GET.get("type", "xlsx")
+    if import_type not in IMPORT_TYPES:
+        raise ValueError(
+            f"Invalid import type {import_type}. Supported import types: {list(IMPORT_TYPES)}"
+        )
+    mode = request.GET.get("mode", APPEND)
+    if mode not in IMPORT_MODES:
+        raise ValueError(
+            f"Invalid import mode {mode}. Supported import modes: {list(IMPORT_MODES)}"
+        )
+    return import_type, mode
+
+
+def get_import_file(request):
+    """
+    Return the uploaded file, the `file` field of a multipart request or else the
+    request body. The body is copied to a temporary file one piece at a time, so
+    a big upload is never held in memory.
+    """
+    if request.content_type == "multipart/form-data":
+        if "file" not in request.FILES:
+            raise ValueError("Multipart import requests need a file field")
+        return request.FILES["file"]
+    import_file = tempfile.TemporaryFile()
+    shutil.copyfileobj(request, import_file, 1024 * 1024)
+    import_file.seek(0)
+    return import_file
+
+
+def iter_xlsx_sheets(import_file):
+    """
+    Yield (resource type, header, rows) for each sheet of a workbook shaped like
+    the `dump_to_excel` output. The workbook is opened in read-only mode, so the
+    rows are parsed lazily from the file instead of being loaded all at once.
+    """
+    try:
+        workbook = load_workbook(import_file, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, KeyError) as e:
+        # a KeyError is raised for zip files that are not workbooks
+        raise ValueError(f"Invalid xlsx file: {e}")
+    try:
+        for sheet in workbook.worksheets:
+            rows = sheet.iter_rows(values_only=True)
+            yield sheet.title, next(rows, None), rows
+    finally:
+        workbook.close()
+
+
+def iter_csv_files(import_file):
+    """
+    Yield (resource type, header, rows) for each csv file of a zip archive shaped
+    like the `stream_dump_to_csv` output, the resource type being the file name.
+    """
+    try:
+        archive = zipfile.ZipFile(import_file)
+    except zipfile.BadZipFile as e:
+        raise ValueError(f"Invalid zip file: {e}")
+    with archive:
+        for name in archive.namelist():
+            if not name.endswith(".csv"):
+                continue
+            resource_type = os.path.splitext(os.path.basename(name))[0]
+            with archive.open(name) as entry:
+                # utf-8-sig also reads the csv files saved with a BOM by excel
+                csv_file = io.TextIOWrapper(entry, encoding="utf-8-sig", newline="")
+                rows = csv.reader(csv_file)
+                yield resource_type, next(rows, None), rows
+
+
+def iter_import_file(import_file, import_type):
+    iter_functions = {"xlsx": iter_xlsx_sheets, "csv": iter_csv_files}
+    return iter_functions[import_type](import_file)
+
+
+def coerce_cell(property_schema, cell):
+    """
+    Convert a cell or csv field to the jsonschema type of its property, the reverse
+    of `to_cell`. Cells that can not be converted are returned as they are, for
+    the validation to report them.
+    """
+    if property_schema is None or "type" not in property_schema:
+        return cell
+    property_type = get_property_type(property_schema)
+    try:
+        if property_type == "string":
+            if isinstance(cell, float) and cell.is_integer():
+                # excel stores all the numbers as floats
+                return str(int(cell))
+            if isinstance(cell, datetime.datetime) and (
+                property_schema.get("format") == "date"
+            ):
+                return cell.date().isoformat()
+            if isinstance(cell, (datetime.date, datetime.time)):
+                return cell.isoformat()
+            return str(cell)
+        if isinstance(cell, str):
+            if property_type in ("object", "array"):
+                return json.loads(cell)
+            return coerce_filter_value(property_type, cell.strip())
+        if property_type == "integer" and isinstance(cell, float) and cell.is_integer():
+            return int(cell)
+    except ValueError:
+        pass
+    return cell
+
+
+def row_to_value(header, properties, row):
+    """
+    Convert a row to a resource value, empty cells are left out.
+    """
+    value = {}
+    for column, cell in zip(header, row):
+        if column is None or cell is None or cell == "":
+            continue
+        value[column] = coerce_cell(properties.get(column), cell)
+    return value
+
+
+def import_resources(sheets, validators, dataset_id, mode, batch_size):
+    """
+    Import the resources of (resource type, header, rows) sheets, see
+    `iter_xlsx_sheets` and `iter_csv_files`.
+    Rows are converted to the schema types, validated a batch at a time and
+    inserted with bulk_create, so memory stays bounded by the batch size.
+    In replace mode, the resources of each imported resource type are deleted first.
+
+    The import is all or nothing: once a row is rejected, the remaining rows are
+    only validated, and everything is rolled back in the end. Rejected rows are
+    reported with their row number, up to DATA_API_INGEST_MAX_REPORTED_ERRORS of them.
+    Return a summary of the created, deleted and rejected rows.
+    """
+    max_reported_errors = getattr(settings, "DATA_API_INGEST_MAX_REPORTED_ERRORS", 1000)
+    summary = {"created": 0, "deleted": 0, "rejected": 0, "errors": []}
+
+    def reject(resource_type, row_number, error):
+        summary["rejected"] += 1
+        if len(summary["errors"]) < max_reported_errors:
+            summary["errors"].append(
+                {"resource_type": resource_type, "row": row_number, **error}
+            )
+
+    def flush(resource_type, validator, batch):
+        for error in validate_values(validator, [value for _, value in batch]):
+            row_number, _ = batch[error.pop("index")]
+            reject(resource_type, row_number, error)
+        if summary["rejected"]:
+            return
+        resources = [
+            Resource(resource_type=resource_type, dataset_id=dataset_id, value=value)
+            for _, value in batch
+        ]
+        summary["created"] += insert_resources(dataset_id, resources, batch_size)
+
+    replaced_resource_types = set()
+    with transaction.atomic():
+        for resource_type, header, rows in sheets:
+            validator = validators.get(resource_type)
+            if validator is None:
+                reject(
+                    resource_type,
+                    None,
+                    {
+                        "error": "Resource type not supported. "
+                        f"Supported resource types: {list(validators)}",
+                        "path": [],
+                    },
+                )
+                continue
+            if header is None:
+                continue
+            header = [None if column is None else str(column) for column in header]
+            properties = validator.schema.get("properties", {})
+
+            if mode == REPLACE and resource_type not in replaced_resource_types:
+                summary["deleted"] += delete_resources(dataset_id, [resource_type])
+                replaced_resource_types.add(resource_type)
+
+            batch = []
+            # the header is row 1, as numbered in a spreadsheet
+            for row_number, row in enumerate(rows, start=2):
+                value = row_to_value(header, properties, row)
+                if not value:
+                    continue
+                batch.append((row_number, value))
+                if len(batch) >= batch_size:
+                    flush(resource_type, validator, batch)
+                    batch = []
+            if batch:
+                flush(resource_type, validator, batch)
+
+        if summary["rejected"]:
+            transaction.set_rollback(True)
+            summary["created"] = 0
+            summary["deleted"] = 0
+
+    return summary
@@ -0,0 +1,237 @@
+import hashlib
+import logging
+
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import F, Q
+
+from .filter_utils import ValueKeyTransform
+from .models import App, Resource
+
+# prefix of the expression indexes managed from the app schemas
+JSON_INDEX_PREFIX = "resource_json_"
+# prefix of the unique indexes over the `x-key` properties
+KEY_INDEX_PREFIX = "resource_key_"
+
+# look an index up by name
+INDEX_EXISTS_SQL = {
+    "sqlite": "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = %s",
+    "postgresql": "SELECT 1 FROM pg_indexes "
+    "WHERE schemaname = current_schema() AND indexname = %s",
+}
+
+logger = logging.getLogger(__name__)
+
+
+class KeyIndexMissing(IntegrityError):
+    """
+    The unique index of a key could not be built, upserts cannot rely on it.
+    """
+
+
+def get_indexed_properties(schemas):
+    """
+    Return the (resource type, property) pairs marked with `"x-indexed": true`
+    in the schemas of an app.
+    """
+    indexed_properties = set()
+    for schema in schemas:
+        resource_type = schema["title"].lower()
+        for property_name, property_schema in schema.get("properties", {}).items():
+            if property_schema.get("x-indexed") is True:
+                indexed_properties.add((resource_type, property_name))
+    return indexed_properties
+
+
+def get_json_index_name(resource_type, property_name):
+    digest = hashlib.md5(f"{resource_type}.{property_name}".encode()).hexdigest()
+    return f"{JSON_INDEX_PREFIX}{digest[:12]}"
+
+
+def build_json_index(resource_type, property_name):
+    """
+    Build the index over (dataset, value -> property), restricted to the rows of
+    the resource type, that serves the filters on an indexed property.
+    """
+    return models.Index(
+        F("dataset"),
+        ValueKeyTransform(property_name),
+        condition=Q(resource_type=resource_type),
+        name=get_json_index_name(resource_type, property_name),
+    )
+
+
+def get_resource_key(schema):
+    """
+    Return the key properties of a resource schema, declared with
+    `"x-key": ["<property>", ...]`, or None if the resource type has no key.
+    """
+    key = schema.get("x-key")
+    if isinstance(key, str):
+        key = [key]
+    return list(key) if key else None
+
+
+def get_key_properties(schemas):
+    """
+    Return the key properties of each resource type of an app that declares a key.
+    """
+    key_properties = {}
+    for schema in schemas:
+        key = get_resource_key(schema)
+        if key is not None:
+            key_properties[schema["title"].lower()] = key
+    return key_properties
+
+
+def get_shared_keys(apps_schemas):
+    """
+    Return the key of each resource type declared with the same key by every app
+    having the resource type. A key index covers the resources of a type whatever
+    their app, so a key that one of the apps does not declare is not enforced.
+    """
+    keys = {}
+    for schemas in apps_schemas:
+        for schema in schemas:
+            resource_type = schema["title"].lower()
+            keys.setdefault(resource_type, []).append(get_resource_key(schema))
+    return {
+        resource_type: declared_keys[0]
+        for resource_type, declared_keys in keys.items()
+        if declared_keys[0] is not None
+        and all(key == declared_keys[0] for key in declared_keys)
+    }
+
+
+def get_key_index_name(resource_type, key):
+    digest = hashlib.md5(f"{resource_type}.{'.'.join(key)}".encode()).hexdigest()
+    return f"{KEY_INDEX_PREFIX}{digest[:12]}"
+
+
+def build_key_index(resource_type, key):
+    """
+    Build the index over (dataset, value -> key properties), restricted to the
+    rows of the resource type. It is created unique, see `create_key_index_sql`.
+    """
+    return models.Index(
+        F("dataset"),
+        *[ValueKeyTransform(property_name) for property_name in key],
+        condition=Q(resource_type=resource_type),
+        name=get_key_index_name(resource_type, key),
+    )
+
+
+def create_key_index_sql(index, schema_editor):
+    # Django 3.2 has no unique constraint over expressions, so the key indexes
+    # are created from the plain index statement
+    statement = index.create_sql(Resource, schema_editor)
+    statement.template = statement.template.replace(
+        "CREATE INDEX", "CREATE UNIQUE INDEX", 1
+    )
+    return statement
+
+
+def get_key_conflict_target(resource_type, key):
+    """
+    Return the ON CONFLICT target of the unique index of a key, its columns and
+    condition compiled exactly as in the index, for the database to match them.
+    """
+    statement = build_key_index(resource_type, key).create_sql(
+        Resource, connection.schema_editor()
+    )
+    return f"({statement.parts['columns']}){statement.parts['condition']}"
+
+
+def supports_json_indexes():
+    features = connection.features
+    return features.supports_expression_indexes and features.supports_partial_indexes
+
+
+def sync_json_indexes():
+    """
+    Create the expression indexes and the unique key indexes declared by the app
+    schemas, and drop the ones that are not declared anymore. Resource types can
+    be shared by several apps, so the indexes are computed from the schemas of
+    all the apps, see `get_shared_keys` for the key indexes.
+    Do nothing if the database does not support partial expression indexes.
+    """
+    if not supports_json_indexes():
+        return
+
+    apps_schemas = list(App.objects.values_list("schemas", flat=True))
+    declared_indexes = {}
+    for schemas in apps_schemas:
+        for resource_type, property_name in get_indexed_properties(schemas):
+            index = build_json_index(resource_type, property_name)
+            declared_indexes[index.name] = index
+    for resource_type, key in get_shared_keys(apps_schemas).items():
+        index = build_key_index(resource_type, key)
+        declared_indexes[index.name] = index
+
+    table_name = Resource._meta.db_table
+    with connection.cursor() as cursor:
+        existing_names = {
+            name
+            for name in connection.introspection.get_constraints(cursor, table_name)
+            if name.startswith((JSON_INDEX_PREFIX, KEY_INDEX_PREFIX))
+        }
+
+    # the statements are run with a plain cursor, as the SQLite schema editor
+    # cannot be entered inside a transaction
+    schema_editor = connection.schema_editor()
+    statements = [
+        models.Index(fields=["id"], name=name).remove_sql(Resource, schema_editor)
+        for name in existing_names - declared_indexes.keys()
+    ]
+    statements += [
+        index.create_sql(Resource, schema_editor)
+        for name, index in declared_indexes.items()
+        if name not in existing_names and name.startswith(JSON_INDEX_PREFIX)
+    ]
+    key_statements = [
+        create_key_index_sql(index, schema_editor)
+        for name, index in declared_indexes.items()
+        if name not in existing_names and name.startswith(KEY_INDEX_PREFIX)
+    ]
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(str(statement))
+        for statement in key_statements:
+            try:
+                with transaction.atomic():
+                    cursor.execute(str(statement))
+            except IntegrityError:
+                # the key cannot be enforced until the duplicated rows are fixed,
+                # upserts of the resource type are rejected meanwhile, see
+                # `ensure_key_index`
+                logger.warning("Duplicated keys, cannot create %s", statement)
+
+
+def has_key_index(resource_type, key):
+    # a single catalog lookup, the introspection reads every index of the table
+    index_name = get_key_index_name(resource_type, key)
+    with connection.cursor() as cursor:
+        sql = INDEX_EXISTS_SQL.get(connection.vendor)
+        if sql is None:
+            return index_name in connection.introspection.get_constraints(
+                cursor, Resource._meta.db_table
+            )
+        cursor.execute(sql, [index_name])
+        return cursor.fetchone() is not None
+
+
+def ensure_key_index(resource_type, key):
+    """
+    Check that the unique index of a key exists, upserts rely on it. The index
+    is missing if the stored resources had duplicated keys when the key was
+    declared, it is built again in case they were fixed since. It is not built
+    either if another app has the resource type without this key.
+    Raise KeyIndexMissing if the index still cannot be built.
+    """
+    if has_key_index(resource_type, key):
+        return
+    sync_json_indexes()
+    if not has_key_index(resource_type, key):
+        raise KeyIndexMissing(
+            f"The {resource_type} key is not enforced, the {resource_type} resources "
+            "have duplicated keys or another app declares another key"
+        )
@@ -0,0 +1,341 @@
+import json
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Q
+
+from .filter_utils import ValueKeyTransform, filter_resources
+from .index_utils import (
+    ensure_key_index,
+    get_key_conflict_target,
+    supports_json_indexes,
+)
+from .models import Dataset, Resource, ResourceChange
+from .schema_util import find_value_error
+
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+
+
+def get_bulk_batch_size(request):
+    """
+    Return the bulk_create batch size, taken from the `batch_size` query parameter
+    and capped by the DATA_API_BULK_MAX_BATCH_SIZE setting.
+    """
+    default_batch_size = getattr(settings, "DATA_API_BULK_BATCH_SIZE", 1000)
+    max_batch_size = getattr(settings, "DATA_API_BULK_MAX_BATCH_SIZE", 10000)
+    batch_size = int(request.GET.get("batch_size", default_batch_size))
+    if batch_size < 1:
+        raise ValueError("batch_size must be a positive integer")
+    return min(batch_size, max_batch_size)
+
+
+def get_stop_on_error(request):
+    """
+    Return whether a streaming ingest should stop at the first invalid line.
+    """
+    return request.GET.get("stop_on_error", "false").lower() in ("true", "1")
+
+
+def get_partial(request):
+    """
+    Return whether a streaming ingest keeps the valid lines of a body that has
+    invalid ones, instead of creating nothing.
+    """
+    return request.GET.get("partial", "false").lower() in ("true", "1")
+
+
+def parse_bulk_body(request):
+    """
+    Parse a json array request body into a list of resource values.
+    """
+    values = json.loads(request.body)
+    if not isinstance(values, list):
+        raise ValueError("Bulk request body must be a json array")
+    return values
+
+
+def validation_error_to_json(error):
+    """
+    Convert a jsonschema validation error to a json serializable dict.
+    """
+    return {"error": error.message, "path": list(error.absolute_path)}
+
+
+def validate_values(validator, values):
+    """
+    Validate all the values against one compiled validator.
+    Return a list of errors, each one carrying the index of the offending value.
+    """
+    errors = []
+    for index, value in enumerate(values):
+        error = find_value_error(validator, value)
+        if error is not None:
+            errors.append({"index": index, **validation_error_to_json(error)})
+    return errors
+
+
+def validate_keys(key, values):
+    """
+    Check that all the values have their key properties.
+    Return a list of errors, each one carrying the index of the offending value.
+    """
+    errors = []
+    for index, value in enumerate(values):
+        missing = [
+            property_name for property_name in key if value.get(property_name) is None
+        ]
+        if missing:
+            errors.append(
+                {
+                    "index": index,
+                    "error": f"Missing key properties {missing}",
+                    "path": [],
+                }
+            )
+    return errors
+
+
+def get_key_filters(key, value):
+    """
+    Return the filters matching the resource with the same key as a value,
+    see `filter_resources`.
+    """
+    return [(property_name, "exact", value[property_name]) for property_name in key]
+
+
+def normalize_key_property(value):
+    # the database compares numbers by value, 1 and 1.0 are the same key
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, dict):
+        return {name: normalize_key_property(item) for name, item in value.items()}
+    if isinstance(value, list):
+        return [normalize_key_property(item) for item in value]
+    return value
+
+
+def get_key_value(key, value):
+    # hashable key of a resource value, the same for the values sent in a request
+    # and the ones read back from the database
+    return tuple(
+        json.dumps(normalize_key_property(value[property_name]), sort_keys=True)
+        for property_name in key
+    )
+
+
+def get_resource_ids_by_key(dataset_id, resource_type, key, values):
+    """
+    Return the ids of the stored resources with the same key as one of the values,
+    keyed by `get_key_value`.
+    """
+    resources = Resource.objects.filter(dataset=dataset_id, resource_type=resource_type)
+    if len(key) == 1:
+        resources = filter_resources(
+            resources, [(key[0], "in", [value[key[0]] for value in values])]
+        )
+    else:
+        aliases = {f"value_key_{index}": name for index, name in enumerate(key)}
+        resources = resources.alias(
+            **{alias: ValueKeyTransform(name) for alias, name in aliases.items()}
+        )
+        condition = Q()
+        for value in values:
+            condition |= Q(**{alias: value[name] for alias, name in aliases.items()})
+        resources = resources.filter(condition)
+    return {
+        get_key_value(key, value): resource_id
+        for resource_id, value in resources.values_list("id", "value")
+    }
+
+
+def upsert_resources(dataset_id, resource_type, key, values, batch_size):
+    """
+    Insert the resource values, or update the stored resources with the same key,
+    with INSERT ... ON CONFLICT DO UPDATE on the unique key index, batch_size rows
+    per statement. The values must have their key properties, when several values
+    share a key the last one wins.
+    All the batches are written and recorded in the change feed inside one transaction.
+    Return the number of created and updated resources.
+    """
+    if not supports_json_indexes():
+        raise ValueError(f"Upserts are not supported on {connection.vendor}")
+    ensure_key_index(resource_type, key)
+
+    # deduplicate the values by key, a statement cannot update a row twice
+    values = list({get_key_value(key, value): value for value in values}.values())
+    value_field = Resource._meta.get_field("value")
+    batch_size = min(
+        batch_size,
+        connection.ops.bulk_batch_size(
+            ["resource_type", "dataset_id", "value"], values
+        ),
+    )
+    quote_name = connection.ops.quote_name
+    insert_sql = (
+        f"INSERT INTO {quote_name(Resource._meta.db_table)} "
+        f"({quote_name('resource_type')}, {quote_name('dataset_id')}, "
+        f"{quote_name('value')}) VALUES %s "
+        f"ON CONFLICT {get_key_conflict_target(resource_type, key)} "
+        f"DO UPDATE SET {quote_name('value')} = excluded.{quote_name('value')}"
+    )
+
+    summary = {"created": 0, "updated": 0}
+    with transaction.atomic():
+        Dataset.bump_version(dataset_id)
+        for start in range(0, len(values), batch_size):
+            batch = values[start : start + batch_size]
+            stored_ids = get_resource_ids_by_key(dataset_id, resource_type, key, batch)
+            params = []
+            for value in batch:
+                params += [
+                    resource_type,
+                    dataset_id,
+                    value_field.get_db_prep_save(value, connection),
+                ]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    insert_sql % ", ".join(["(%s, %s, %s)"] * len(batch)), params
+                )
+
+            # the created resources get their ids from a second lookup
+            resource_ids = get_resource_ids_by_key(
+                dataset_id, resource_type, key, batch
+            )
+            changes = []
+            for value in batch:
+                key_value = get_key_value(key, value)
+                op = (
+                    ResourceChange.UPDATE
+                    if key_value in stored_ids
+                    else ResourceChange.CREATE
+                )
+                summary["created" if op == ResourceChange.CREATE else "updated"] += 1
+                changes.append(
+                    ResourceChange(
+                        dataset_id=dataset_id,
+                        op=op,
+                        resource_type=resource_type,
+                        resource_id=resource_ids[key_value],
+                        value=value,
+                    )
+                )
+            ResourceChange.objects.bulk_create(changes)
+    return summary
+
+
+def insert_resources(dataset_id, resources, batch_size):
+    """
+    Insert resources of a dataset with bulk_create, batch_size rows per INSERT,
+    and record them in the change feed, inside one transaction.
+    """
+    with transaction.atomic():
+        # bumping the version first takes the write lock before the last
+        # resource id is read
+        Dataset.bump_version(dataset_id)
+        last_id = Resource.objects.aggregate(last_id=Max("id"))["last_id"]
+        Resource.objects.bulk_create(resources, batch_size=batch_size)
+        ResourceChange.record_bulk_create(dataset_id, resources, last_id)
+    return len(resources)
+
+
+def delete_resources(dataset_id, resource_types):
+    """
+    Delete all the resources of some types of a dataset, and record them in the
+    change feed, inside one transaction. Resource has no signal receivers nor
+    cascades, so the rows are deleted with a single DELETE.
+    Return the number of deleted resources.
+    """
+    with transaction.atomic():
+        Dataset.bump_version(dataset_id)
+        ResourceChange.record_bulk_delete(dataset_id, resource_types)
+        deleted, _ = Resource.objects.filter(
+            dataset=dataset_id, resource_type__in=resource_types
+        ).delete()
+        return deleted
+
+
+def bulk_create_resources(dataset_id, resource_type, values, batch_size):
+    """
+    Insert the resource values with bulk_create, batch_size rows per INSERT.
+    All the batches are written inside one transaction.
+    """
+    resources = [
+        Resource(resource_type=resource_type, dataset_id=dataset_id, value=value)
+        for value in values
+    ]
+    return insert_resources(dataset_id, resources, batch_size)
+
+
+def stream_ingest_resources(
+    lines,
+    validator,
+    dataset_id,
+    resource_type,
+    batch_size,
+    stop_on_error=False,
+    partial=False,
+):
+    """
+    Ingest NDJSON lines one at a time, so the whole body is never held in memory.
+    Valid rows are buffered and flushed with bulk_create every batch_size rows.
+    Invalid rows are rejected and reported with their line number, up to
+    DATA_API_INGEST_MAX_REPORTED_ERRORS of them.
+    All the lines are ingested in one transaction, rolled back if any of them is
+    rejected. With `partial` set, each flush is committed on its own instead and
+    the valid rows are kept.
+    Return a summary of the accepted and rejected rows.
+    """
+    if not partial:
+        with transaction.atomic():
+            summary = stream_ingest_resources(
+                lines,
+                validator,
+                dataset_id,
+                resource_type,
+                batch_size,
+                stop_on_error=stop_on_error,
+                partial=True,
+            )
+            if summary["rejected"]:
+                transaction.set_rollback(True)
+                summary["accepted"] = 0
+        return summary
+
+    max_reported_errors = getattr(settings, "DATA_API_INGEST_MAX_REPORTED_ERRORS", 1000)
+    accepted = 0
+    rejected = 0
+    errors = []
+    batch = []
+
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        error = None
+        try:
+            value = json.loads(line)
+        except ValueError as e:
+            error = {"error": f"Invalid json: {e}", "path": []}
+        else:
+            validation_error = find_value_error(validator, value)
+            if validation_error is not None:
+                error = validation_error_to_json(validation_error)
+
+        if error:
+            rejected += 1
+            if len(errors) < max_reported_errors:
+                errors.append({"line": line_number, **error})
+            if stop_on_error:
+                break
+            continue
+
+        batch.append(
+            Resource(resource_type=resource_type, dataset_id=dataset_id, value=value)
+        )
+        if len(batch) >= batch_size:
+            accepted += insert_resources(dataset_id, batch, batch_size)
+            batch = []
+
+    if batch:
+        accepted += insert_resources(dataset_id, batch, batch_size)
+
+    return {"accepted": accepted, "rejected": rejected, "errors": errors}
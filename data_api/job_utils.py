@@ -0,0 +1,129 @@
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .dump_utils import DUMP_FILE_EXTENSIONS, dump_to_excel, stream_dump
+from .models import DumpJob
+
+# the worker pool is created on the first submitted job
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "DATA_API_DUMP_JOB_WORKERS", 2),
+                thread_name_prefix="dump-job",
+            )
+    return _executor
+
+
+def get_dump_job_dir():
+    job_dir = getattr(
+        settings,
+        "DATA_API_DUMP_JOB_DIR",
+        os.path.join(tempfile.gettempdir(), "dag_dump_jobs"),
+    )
+    os.makedirs(job_dir, exist_ok=True)
+    return job_dir
+
+
+def submit_dump_job(dataset_id, dump_type):
+    """
+    Create a dump job for a dataset and queue it on the local worker pool.
+    The files of the expired jobs are removed on the way.
+    """
+    purge_expired_dump_jobs()
+    job = DumpJob.objects.create(dataset_id=dataset_id, dump_type=dump_type)
+    # the worker must not look the job up before it is committed
+    transaction.on_commit(lambda: get_executor().submit(run_dump_job, job.id))
+    return job
+
+
+def run_dump_job(job_id):
+    """
+    Build the dump file of a job. Runs in a worker thread, with its own database
+    connection.
+    """
+    close_old_connections()
+    try:
+        build_dump_job(DumpJob.objects.get(id=job_id))
+    finally:
+        connection.close()
+
+
+def build_dump_job(job):
+    """
+    Write the dump file of a job, recording the rows written per resource type.
+    """
+    file_name = f"job_{job.id}.{DUMP_FILE_EXTENSIONS[job.dump_type]}"
+    job.status = DumpJob.RUNNING
+    # recorded before the file is written, so the file of a job interrupted
+    # midway is still purged
+    job.file_path = os.path.join(get_dump_job_dir(), file_name)
+    job.save(update_fields=["status", "file_path"])
+
+    def progress(resource_type, rows):
+        job.progress[resource_type] = rows
+        job.save(update_fields=["progress"])
+
+    try:
+        with open(job.file_path, "wb") as dump_file:
+            if job.dump_type == "xlsx":
+                dump_to_excel(job.dataset_id, output=dump_file, progress=progress)
+            else:
+                for chunk in stream_dump(job.dataset_id, job.dump_type, progress):
+                    dump_file.write(chunk)
+        job.status = DumpJob.DONE
+    except Exception as e:
+        job.status = DumpJob.FAILED
+        job.error = str(e)
+        remove_dump_file(job.file_path)
+        job.file_path = None
+    finally:
+        job.finished_at = timezone.now()
+        job.expires_at = job.finished_at + timedelta(
+            seconds=getattr(settings, "DATA_API_DUMP_JOB_TTL", 3600)
+        )
+        job.save()
+
+
+def remove_dump_file(file_path):
+    if file_path and os.path.exists(file_path):
+        os.remove(file_path)
+
+
+def purge_expired_dump_jobs():
+    """
+    Delete the files of the expired dump jobs. The jobs themselves are kept, so
+    their downloads keep answering 410, until their dataset is deleted.
+    The jobs pending or running for more than DATA_API_DUMP_JOB_TIMEOUT seconds
+    are failed first, they were lost with the process running them and would
+    never expire otherwise. They are kept DATA_API_DUMP_JOB_TTL seconds as well.
+    """
+    now = timezone.now()
+    timeout = getattr(settings, "DATA_API_DUMP_JOB_TIMEOUT", 6 * 3600)
+    ttl = getattr(settings, "DATA_API_DUMP_JOB_TTL", 3600)
+    DumpJob.objects.filter(
+        status__in=[DumpJob.PENDING, DumpJob.RUNNING],
+        created_at__lte=now - timedelta(seconds=timeout),
+    ).update(
+        status=DumpJob.FAILED,
+        error="The dump job was interrupted",
+        finished_at=now,
+        expires_at=now + timedelta(seconds=ttl),
+    )
+
+    expired_jobs = DumpJob.objects.filter(expires_at__lte=now, file_path__isnull=False)
+    for file_path in expired_jobs.values_list("file_path", flat=True):
+        remove_dump_file(file_path)
+    expired_jobs.update(file_path=None)
@@ -0,0 +1,104 @@
+import functools
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import TextField
+from django.db.models.functions import Cast
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib encoder is used without it
+    orjson = None
+
+
+def stdlib_dumps(value):
+    """
+    Encode a value to json bytes with the stdlib encoder.
+    """
+    return json.dumps(value, cls=DjangoJSONEncoder).encode()
+
+
+def orjson_dumps(value):
+    """
+    Encode a value to json bytes with orjson, several times faster than the stdlib.
+    The values orjson does not take, e.g. integers above 64 bits, are encoded by
+    the stdlib instead.
+    """
+    try:
+        return orjson.dumps(
+            value,
+            default=DjangoJSONEncoder().default,
+            option=orjson.OPT_NON_STR_KEYS,
+        )
+    except orjson.JSONEncodeError:
+        return stdlib_dumps(value)
+
+
+@functools.lru_cache(maxsize=None)
+def load_json_serializer(path):
+    if path is not None:
+        return import_string(path)
+    return stdlib_dumps if orjson is None else orjson_dumps
+
+
+def get_json_serializer():
+    """
+    Return the function encoding the responses to json bytes: the one at the
+    DATA_API_JSON_SERIALIZER dotted path, by default orjson if it is installed.
+    """
+    return load_json_serializer(getattr(settings, "DATA_API_JSON_SERIALIZER", None))
+
+
+def dumps(value):
+    """
+    Encode a value to json bytes, see `get_json_serializer`.
+    """
+    return get_json_serializer()(value)
+
+
+class JsonResponse(HttpResponse):
+    """
+    Same as django.http.JsonResponse, with the data encoded by `dumps`.
+    """
+
+    def __init__(self, data, safe=True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError(
+                "In order to allow non-dict objects to be serialized set the "
+                "safe parameter to False."
+            )
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(content=dumps(data), **kwargs)
+
+
+def raw_json(field_name):
+    """
+    Return an expression selecting a json field as the json text stored in the
+    database, to be written as is in a response instead of decoded and encoded
+    again.
+    """
+    return Cast(field_name, output_field=TextField())
+
+
+# the fields of Resource.to_json, with the value as json text
+RESOURCE_ROW_FIELDS = ("id", "resource_type", "dataset_id", raw_json("value"))
+
+
+def resource_rows_to_json(rows):
+    """
+    Encode resources fetched with .values_list(*RESOURCE_ROW_FIELDS) to a json
+    array of Resource.to_json objects, without building a dict per resource.
+    """
+    resource_types = {}
+    parts = []
+    for resource_id, resource_type, dataset_id, value in rows:
+        if resource_type not in resource_types:
+            resource_types[resource_type] = json.dumps(resource_type)
+        parts.append(
+            f'{{"id":{resource_id},"resource_type":{resource_types[resource_type]},'
+            f'"dataset":{dataset_id},"value":{value}}}'
+        )
+    return f"[{','.join(parts)}]".encode()
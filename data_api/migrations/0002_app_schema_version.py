@@ -0,0 +1,18 @@
+# Generated by Django 3.2.4 on 2026-10-18 05:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("data_api", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="app",
+            name="schema_version",
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
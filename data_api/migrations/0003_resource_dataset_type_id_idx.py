@@ -0,0 +1,20 @@
+# Generated by Django 3.2.4 on 2026-10-18 05:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("data_api", "0002_app_schema_version"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="resource",
+            index=models.Index(
+                fields=["dataset", "resource_type", "id"],
+                name="resource_dataset_type_id_idx",
+            ),
+        ),
+    ]
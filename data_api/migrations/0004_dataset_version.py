@@ -0,0 +1,24 @@
+# Generated by Django 3.2.4 on 2026-10-18 05:36
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("data_api", "0003_resource_dataset_type_id_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="dataset",
+            name="modified_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name="dataset",
+            name="version",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 3.2.4 on 2026-10-18 05:37
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("data_api", "0004_dataset_version"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ResourceChange",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "op",
+                    models.CharField(
+                        choices=[
+                            ("create", "create"),
+                            ("update", "update"),
+                            ("delete", "delete"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("resource_type", models.CharField(max_length=100)),
+                ("resource_id", models.BigIntegerField()),
+                ("value", models.JSONField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "dataset",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="changes",
+                        to="data_api.dataset",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="resourcechange",
+            index=models.Index(fields=["dataset", "id"], name="change_dataset_id_idx"),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.4 on 2026-10-18 05:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("data_api", "0006_dumpjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="dataset",
+            name="is_snapshot",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name="dataset",
+            name="source",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="copies",
+                to="data_api.dataset",
+            ),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+# PostgreSQL only, filters on the resource values are containment queries there,
+# see `filter_resources`
+GIN_INDEX_SQL = (
+    "CREATE INDEX IF NOT EXISTS resource_value_gin_idx "
+    "ON data_api_resource USING GIN (value jsonb_path_ops)"
+)
+DROP_GIN_INDEX_SQL = "DROP INDEX IF EXISTS resource_value_gin_idx"
+
+
+def create_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(GIN_INDEX_SQL)
+
+
+def drop_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(DROP_GIN_INDEX_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("data_api", "0007_dataset_copies"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_gin_index, drop_gin_index),
+    ]
@@ -1,14 +1,27 @@
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import F
+from django.utils import timezone
 
 
 class App(models.Model):
     name = models.CharField(max_length=100)
     description = models.CharField(max_length=100, null=True, blank=True)
     schemas = models.JSONField(null=False, blank=False)
+    # bumped every time the schemas change, used to key compiled validators
+    schema_version = models.PositiveIntegerField(default=1)
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            stored_schemas = (
+                App.objects.filter(pk=self.pk).values_list("schemas", flat=True).first()
+            )
+            if stored_schemas is not None and stored_schemas != self.schemas:
+                self.schema_version += 1
+        super().save(*args, **kwargs)
+
     def to_json(self):
         return {
             "id": self.id,
@@ -22,26 +35,93 @@ class Dataset(models.Model):
     name = models.CharField(max_length=100)
     description = models.CharField(max_length=100, null=True, blank=True)
     app = models.ForeignKey(App, on_delete=models.CASCADE, related_name="datasets")
+    # bumped every time a resource of the dataset changes, used to key the dumps
+    version = models.PositiveBigIntegerField(default=0)
+    modified_at = models.DateTimeField(default=timezone.now)
+    # the dataset this one was copied from, see `copy`
+    source = models.ForeignKey(
+        "self",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="copies",
+    )
+    # snapshots are immutable copies
+    is_snapshot = models.BooleanField(default=False)
 
     def __str__(self):
         return self.name
 
+    def copy(self, name, description=None, snapshot=False):
+        """
+        Create a copy of the dataset, a snapshot if `snapshot` is set.
+        The resources are copied inside the database with a single INSERT ... SELECT,
+        no row goes through python. The change feed of the copy starts empty.
+        """
+        with transaction.atomic():
+            dataset_copy = Dataset.objects.create(
+                name=name,
+                description=description,
+                app_id=self.app_id,
+                source=self,
+                is_snapshot=snapshot,
+            )
+            quote_name = connection.ops.quote_name
+            resource_table = quote_name(Resource._meta.db_table)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {resource_table} (resource_type, dataset_id, value) "
+                    f"SELECT resource_type, %s, value FROM {resource_table} "
+                    "WHERE dataset_id = %s ORDER BY id",
+                    [dataset_copy.id, self.id],
+                )
+        return dataset_copy
+
+    @classmethod
+    def bump_version(cls, dataset_id):
+        """
+        Record that the resources of a dataset changed.
+        The update locks the dataset row until the transaction ends, so it is called
+        before recording changes: the writers of a dataset then take their change
+        sequence numbers one transaction at a time, and the changes are committed
+        in sequence order even on PostgreSQL, where sequence values are allocated
+        before commit.
+        """
+        cls.objects.filter(id=dataset_id).update(
+            version=F("version") + 1, modified_at=timezone.now()
+        )
+
     def to_json(self):
         return {
             "id": self.id,
             "name": self.name,
             "description": self.description,
-            "app": self.app.pk,
+            "app": self.app_id,
+            "source": self.source_id,
+            "is_snapshot": self.is_snapshot,
         }
 
 
 class Resource(models.Model):
+    # the columns needed to serialize a resource without instantiating it
+    JSON_FIELDS = ("id", "resource_type", "dataset_id", "value")
+
     resource_type = models.CharField(max_length=100)
     dataset = models.ForeignKey(
         Dataset, on_delete=models.CASCADE, related_name="resources"
     )
     value = models.JSONField(null=False, blank=False)
 
+    class Meta:
+        indexes = [
+            # lists filter on (dataset, resource_type) and page by id,
+            # dumps scan a dataset ordered by (resource_type, id)
+            models.Index(
+                fields=["dataset", "resource_type", "id"],
+                name="resource_dataset_type_id_idx",
+            ),
+        ]
+
     def __str__(self):
         return f"{self.resource_type} - {self.value}"
 
@@ -49,6 +129,184 @@ class Resource(models.Model):
         return {
             "id": self.id,
             "resource_type": self.resource_type,
-            "dataset": self.dataset.pk,
+            "dataset": self.dataset_id,
+            "value": self.value,
+        }
+
+    @staticmethod
+    def row_to_json(row):
+        """
+        Same as to_json, for a row fetched with .values(*Resource.JSON_FIELDS).
+        """
+        return {
+            "id": row["id"],
+            "resource_type": row["resource_type"],
+            "dataset": row["dataset_id"],
+            "value": row["value"],
+        }
+
+
+class ResourceChange(models.Model):
+    """
+    One entry of the change feed of a dataset, its id is the sequence number.
+    Changes are recorded after `Dataset.bump_version` in the same transaction, so
+    a reader paging by sequence number does not skip changes committed later.
+    """
+
+    CREATE = "create"
+    UPDATE = "update"
+    DELETE = "delete"
+    OPS = [(CREATE, "create"), (UPDATE, "update"), (DELETE, "delete")]
+
+    dataset = models.ForeignKey(
+        Dataset, on_delete=models.CASCADE, related_name="changes"
+    )
+    op = models.CharField(max_length=10, choices=OPS)
+    resource_type = models.CharField(max_length=100)
+    resource_id = models.BigIntegerField()
+    value = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # the feed of a dataset is read in sequence order
+            models.Index(fields=["dataset", "id"], name="change_dataset_id_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.id} {self.op} {self.resource_type} {self.resource_id}"
+
+    def to_json(self):
+        return {
+            "seq": self.id,
+            "op": self.op,
+            "resource_type": self.resource_type,
+            "resource_id": self.resource_id,
             "value": self.value,
+            "created_at": self.created_at.isoformat(),
+        }
+
+    @classmethod
+    def record(cls, op, resource):
+        """
+        Record a change of a single resource.
+        """
+        return cls.objects.create(
+            dataset_id=resource.dataset_id,
+            op=op,
+            resource_type=resource.resource_type,
+            resource_id=resource.id,
+            value=None if op == cls.DELETE else resource.value,
+        )
+
+    @classmethod
+    def record_bulk_create(cls, dataset_id, resources, last_id):
+        """
+        Record the creation of resources inserted with bulk_create.
+        Backends that do not return the ids from bulk_create get the changes copied
+        in the database from the resources of the dataset with an id above last_id,
+        so the caller must hold the write lock since reading last_id.
+        """
+        if connection.features.can_return_rows_from_bulk_insert:
+            cls.objects.bulk_create(
+                [
+                    cls(
+                        dataset_id=dataset_id,
+                        op=cls.CREATE,
+                        resource_type=resource.resource_type,
+                        resource_id=resource.id,
+                        value=resource.value,
+                    )
+                    for resource in resources
+                ]
+            )
+            return
+
+        quote_name = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {quote_name(cls._meta.db_table)} "
+                "(dataset_id, op, resource_type, resource_id, value, created_at) "
+                "SELECT dataset_id, %s, resource_type, id, value, %s "
+                f"FROM {quote_name(Resource._meta.db_table)} "
+                "WHERE dataset_id = %s AND id > %s ORDER BY id",
+                [
+                    cls.CREATE,
+                    connection.ops.adapt_datetimefield_value(timezone.now()),
+                    dataset_id,
+                    last_id or 0,
+                ],
+            )
+
+    @classmethod
+    def record_bulk_delete(cls, dataset_id, resource_types):
+        """
+        Record the deletion of all the resources of some types of a dataset.
+        The changes are copied in the database from the resources, which must
+        be deleted afterwards in the same transaction.
+        """
+        if not resource_types:
+            return
+        quote_name = connection.ops.quote_name
+        placeholders = ", ".join(["%s"] * len(resource_types))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {quote_name(cls._meta.db_table)} "
+                "(dataset_id, op, resource_type, resource_id, value, created_at) "
+                "SELECT dataset_id, %s, resource_type, id, NULL, %s "
+                f"FROM {quote_name(Resource._meta.db_table)} "
+                f"WHERE dataset_id = %s AND resource_type IN ({placeholders}) "
+                "ORDER BY id",
+                [
+                    cls.DELETE,
+                    connection.ops.adapt_datetimefield_value(timezone.now()),
+                    dataset_id,
+                    *resource_types,
+                ],
+            )
+
+
+class DumpJob(models.Model):
+    """
+    A dataset dump built in the background, see `job_utils`.
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUSES = [
+        (PENDING, "pending"),
+        (RUNNING, "running"),
+        (DONE, "done"),
+        (FAILED, "failed"),
+    ]
+
+    dataset = models.ForeignKey(
+        Dataset, on_delete=models.CASCADE, related_name="dump_jobs"
+    )
+    dump_type = models.CharField(max_length=10)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    # number of rows written so far, per resource type (one sheet per type in xlsx)
+    progress = models.JSONField(default=dict)
+    error = models.TextField(null=True, blank=True)
+    file_path = models.CharField(max_length=255, null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.dump_type} dump of {self.dataset_id} ({self.status})"
+
+    def to_json(self):
+        return {
+            "id": self.id,
+            "dataset": self.dataset_id,
+            "dump_type": self.dump_type,
+            "status": self.status,
+            "progress": self.progress,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at and self.finished_at.isoformat(),
+            "expires_at": self.expires_at and self.expires_at.isoformat(),
         }
@@ -0,0 +1,57 @@
+from django.conf import settings
+
+
+def get_page_params(request, cursor_parameter="cursor"):
+    """
+    Return the (limit, cursor) keyset pagination parameters of a list request.
+    The limit defaults to DATA_API_PAGE_SIZE and is capped by DATA_API_MAX_PAGE_SIZE,
+    the cursor is the id of the last item of the previous page.
+    """
+    default_limit = getattr(settings, "DATA_API_PAGE_SIZE", 100)
+    max_limit = getattr(settings, "DATA_API_MAX_PAGE_SIZE", 1000)
+    try:
+        limit = int(request.GET.get("limit", default_limit))
+        cursor = request.GET.get(cursor_parameter)
+        cursor = int(cursor) if cursor else None
+    except ValueError:
+        raise ValueError(f"limit and {cursor_parameter} must be integers")
+    if limit < 1:
+        raise ValueError("limit must be a positive integer")
+    return min(limit, max_limit), cursor
+
+
+def paginate_queryset(queryset, limit, cursor):
+    """
+    Return one page of the queryset ordered by id, starting after the cursor,
+    and the cursor of the next page (None on the last page).
+    One extra row is fetched to know if there is a next page.
+    The queryset can yield model instances, `.values()` dicts or `.values_list()`
+    tuples starting with the id.
+    """
+    queryset = queryset.order_by("id")
+    if cursor is not None:
+        queryset = queryset.filter(id__gt=cursor)
+    page = list(queryset[: limit + 1])
+    if len(page) > limit:
+        page = page[:limit]
+        last = page[-1]
+        if isinstance(last, dict):
+            return page, last["id"]
+        if isinstance(last, tuple):
+            return page, last[0]
+        return page, last.id
+    return page, None
+
+
+def set_next_link(request, response, next_cursor, cursor_parameter="cursor"):
+    """
+    Add the link to the next page to the response, as a `Link` header.
+    """
+    if next_cursor is None:
+        return response
+    query = request.GET.copy()
+    query[cursor_parameter] = next_cursor
+    next_url = request.build_absolute_uri(f"{request.path}?{query.urlencode()}")
+    response["Link"] = f'<{next_url}>; rel="next"'
+    response["X-Next-Cursor"] = str(next_cursor)
+    return response
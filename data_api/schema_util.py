@@ -1,5 +1,151 @@
+import hashlib
+import json
+import threading
+
+import jsonschema
+
+from .expand_utils import get_references
+from .filter_utils import get_filter_operators, get_property_type
+from .index_utils import get_resource_key
 from .models import App
 
+# compiled validators, keyed by (app id, schema version)
+_validator_cache = {}
+_validator_cache_lock = threading.Lock()
+
+# serialized openapi documents, app id -> (etag, payload)
+_openapi_cache = {}
+
+
+def compile_app_validators(schemas):
+    """
+    Compile a jsonschema validator for every resource schema of an app.
+    Return a dict mapping the resource type to its validator.
+    """
+    validators = {}
+    for schema in schemas:
+        validator_class = jsonschema.validators.validator_for(schema)
+        validator_class.check_schema(schema)
+        validators[schema["title"].lower()] = validator_class(schema)
+    return validators
+
+
+def get_app_validators(app_id):
+    """
+    Return the compiled validators of an app, compiling them on a cache miss.
+    A single query is needed to check the schema version of the app.
+    """
+    schema_version = (
+        App.objects.filter(id=app_id).values_list("schema_version", flat=True).first()
+    )
+    if schema_version is None:
+        raise App.DoesNotExist(f"App {app_id} does not exist")
+
+    key = (int(app_id), schema_version)
+    validators = _validator_cache.get(key)
+    if validators is not None:
+        return validators
+
+    with _validator_cache_lock:
+        validators = _validator_cache.get(key)
+        if validators is None:
+            app = App.objects.get(id=app_id)
+            validators = compile_app_validators(app.schemas)
+            # drop the validators compiled for older schema versions
+            for stale_key in [k for k in _validator_cache if k[0] == key[0]]:
+                del _validator_cache[stale_key]
+            _validator_cache[(key[0], app.schema_version)] = validators
+    return validators
+
+
+def get_resource_validator(app_id, resource_type):
+    """
+    Return the compiled validator for a resource type of an app.
+    """
+    validators = get_app_validators(app_id)
+    if resource_type not in validators:
+        raise Exception(
+            f"Resource type not supported. Supported resource types: {list(validators)}"
+        )
+    return validators[resource_type]
+
+
+def find_value_error(validator, value):
+    """
+    Return the most relevant validation error of a resource value, or None if valid.
+    """
+    return jsonschema.exceptions.best_match(validator.iter_errors(value))
+
+
+def validate_value(validator, value):
+    """
+    Validate a resource value against a compiled validator.
+    Raise the most relevant jsonschema.exceptions.ValidationError if invalid.
+    """
+    error = find_value_error(validator, value)
+    if error is not None:
+        raise error
+
+
+def generate_openapi_filter_parameters(resource_schema):
+    """
+    Generate openapi query parameters for the filters supported by each property
+    of a jsonschema defined resource
+    """
+    parameters = []
+    for property_name, property_schema in resource_schema.get("properties", {}).items():
+        property_type = get_property_type(property_schema)
+        for operator in get_filter_operators(property_schema):
+            if operator == "exact":
+                name = property_name
+                description = f"{property_name} equals"
+                schema = {"type": property_type}
+            elif operator == "in":
+                name = f"{property_name}__in"
+                description = f"{property_name} in a comma separated list"
+                schema = {"type": "string"}
+            elif operator == "isnull":
+                name = f"{property_name}__isnull"
+                description = f"{property_name} is missing"
+                schema = {"type": "boolean"}
+            else:
+                name = f"{property_name}__{operator}"
+                description = f"{property_name} {operator}"
+                schema = {"type": property_type}
+            parameters.append(
+                {
+                    "name": name,
+                    "in": "query",
+                    "description": description,
+                    "required": False,
+                    "schema": schema,
+                }
+            )
+    return parameters
+
+
+def generate_openapi_expand_parameters(resource_schema):
+    """
+    Generate the openapi `expand` query parameter of a resource declaring references
+    """
+    references = get_references(resource_schema)
+    if not references:
+        return []
+    return [
+        {
+            "name": "expand",
+            "in": "query",
+            "description": "Comma separated list of the references to expand",
+            "required": False,
+            "style": "form",
+            "explode": False,
+            "schema": {
+                "type": "array",
+                "items": {"type": "string", "enum": list(references)},
+            },
+        }
+    ]
+
 
 def generate_openapi_paths(url_prefix, resource_schema):
     """
@@ -13,10 +159,17 @@ def generate_openapi_paths(url_prefix, resource_schema):
                 "summary": f"List {resource_type}",
                 "description": f"List all {resource_type}",
                 "operationId": f"list_{resource_type}",
-                "parameters": [{"$ref": "#/components/parameters/dataset_id"}],
+                "parameters": [
+                    {"$ref": "#/components/parameters/dataset_id"},
+                    {"$ref": "#/components/parameters/limit"},
+                    {"$ref": "#/components/parameters/cursor"},
+                    *generate_openapi_filter_parameters(resource_schema),
+                    *generate_openapi_expand_parameters(resource_schema),
+                ],
                 "responses": {
                     "200": {
                         "description": f"List of {resource_type}",
+                        "headers": {"Link": {"$ref": "#/components/headers/Link"}},
                         "content": {
                             "application/json": {
                                 "schema": {
@@ -60,6 +213,123 @@ def generate_openapi_paths(url_prefix, resource_schema):
                 },
             },
         },
+        f"/{url_prefix}/{resource_type}/bulk": {
+            "post": {
+                "summary": f"Bulk create {resource_type}",
+                "description": f"Create many {resource_type} in one request",
+                "operationId": f"bulk_create_{resource_type}",
+                "parameters": [
+                    {"$ref": "#/components/parameters/dataset_id"},
+                    {"$ref": "#/components/parameters/batch_size"},
+                    {
+                        "name": "stop_on_error",
+                        "in": "query",
+                        "description": "Stop a NDJSON ingest at the first invalid line",
+                        "required": False,
+                        "schema": {"type": "boolean", "default": False},
+                    },
+                    {
+                        "name": "partial",
+                        "in": "query",
+                        "description": "Keep the valid lines of a NDJSON ingest "
+                        "that has invalid ones, instead of creating nothing",
+                        "required": False,
+                        "schema": {"type": "boolean", "default": False},
+                    },
+                ],
+                "requestBody": {
+                    "description": f"{resource_type} list to create",
+                    "content": {
+                        "application/json": {
+                            "schema": {
+                                "type": "array",
+                                "items": {
+                                    "$ref": f"#/components/schemas/{resource_type}"
+                                },
+                            }
+                        },
+                        "application/x-ndjson": {
+                            "schema": {"$ref": f"#/components/schemas/{resource_type}"}
+                        },
+                    },
+                    "required": True,
+                },
+                "responses": {
+                    "201": {
+                        "description": f"{resource_type} created",
+                        "content": {
+                            "application/json": {
+                                "schema": {
+                                    "type": "object",
+                                    "properties": {"created": {"type": "integer"}},
+                                }
+                            }
+                        },
+                    },
+                    "207": {
+                        "description": "NDJSON ingest with partial=true, the valid "
+                        "lines were created and the invalid ones are reported"
+                    },
+                    "400": {
+                        "description": "Invalid items, reported by index "
+                        "(json array) or line number (NDJSON), nothing was created"
+                    },
+                },
+            },
+        },
+        f"/{url_prefix}/{resource_type}/aggregate": {
+            "get": {
+                "summary": f"Aggregate {resource_type}",
+                "description": f"Group and aggregate {resource_type}",
+                "operationId": f"aggregate_{resource_type}",
+                "parameters": [
+                    {"$ref": "#/components/parameters/dataset_id"},
+                    {
+                        "name": "group_by",
+                        "in": "query",
+                        "description": "Comma separated properties to group by",
+                        "required": False,
+                        "schema": {"type": "string"},
+                    },
+                    {
+                        "name": "metrics",
+                        "in": "query",
+                        "description": "Comma separated <function>:<property>, "
+                        "function one of count, sum, min, max, avg",
+                        "required": False,
+                        "schema": {"type": "string", "default": "count"},
+                    },
+                    {
+                        "name": "bucket",
+                        "in": "query",
+                        "description": "Comma separated <property>:<day|week|month|year>, "
+                        "group a date property by the start of its bucket",
+                        "required": False,
+                        "schema": {"type": "string"},
+                    },
+                    *generate_openapi_filter_parameters(resource_schema),
+                ],
+                "responses": {
+                    "200": {
+                        "description": f"Aggregated {resource_type}",
+                        "content": {
+                            "application/json": {
+                                "schema": {
+                                    "type": "array",
+                                    "items": {
+                                        "type": "object",
+                                        "properties": {
+                                            "group": {"type": "object"},
+                                            "metrics": {"type": "object"},
+                                        },
+                                    },
+                                }
+                            }
+                        },
+                    }
+                },
+            }
+        },
         f"/{url_prefix}/{resource_type}/{{resource_id}}/": {
             "get": {
                 "summary": f"Get {resource_type}",
@@ -74,6 +344,7 @@ def generate_openapi_paths(url_prefix, resource_schema):
                         "schema": {"type": "integer", "format": "int64"},
                     },
                     {"$ref": "#/components/parameters/dataset_id"},
+                    *generate_openapi_expand_parameters(resource_schema),
                 ],
                 "responses": {
                     "200": {
@@ -142,9 +413,124 @@ def generate_openapi_paths(url_prefix, resource_schema):
             },
         },
     }
+    key = get_resource_key(resource_schema)
+    if key is not None:
+        bulk_path = paths[f"/{url_prefix}/{resource_type}/bulk"]
+        bulk_path["put"] = generate_openapi_bulk_upsert_operation(resource_type)
+        paths[f"/{url_prefix}/{resource_type}/by-key"] = generate_openapi_key_path(
+            resource_schema, key
+        )
     return paths
 
 
+def generate_openapi_bulk_upsert_operation(resource_type):
+    """
+    Generate openapi operation definition of the bulk upsert by key of a resource
+    """
+    return {
+        "summary": f"Bulk upsert {resource_type}",
+        "description": f"Create or update many {resource_type} by key in one request",
+        "operationId": f"bulk_upsert_{resource_type}",
+        "parameters": [
+            {"$ref": "#/components/parameters/dataset_id"},
+            {"$ref": "#/components/parameters/batch_size"},
+        ],
+        "requestBody": {
+            "description": f"{resource_type} list to upsert",
+            "content": {
+                "application/json": {
+                    "schema": {
+                        "type": "array",
+                        "items": {"$ref": f"#/components/schemas/{resource_type}"},
+                    }
+                }
+            },
+            "required": True,
+        },
+        "responses": {
+            "200": {
+                "description": f"{resource_type} upserted",
+                "content": {
+                    "application/json": {
+                        "schema": {
+                            "type": "object",
+                            "properties": {
+                                "created": {"type": "integer"},
+                                "updated": {"type": "integer"},
+                            },
+                        }
+                    }
+                },
+            },
+            "400": {"description": "Invalid items, reported by index"},
+        },
+    }
+
+
+def generate_openapi_key_path(resource_schema, key):
+    """
+    Generate openapi path definition (GET, PUT) by key of a resource declaring
+    its key properties with `x-key`
+    """
+    resource_type = resource_schema["title"].lower()
+    properties = resource_schema.get("properties", {})
+    resource_content = {
+        "application/json": {
+            "schema": {"$ref": f"#/components/schemas/{resource_type}"}
+        }
+    }
+    return {
+        "get": {
+            "summary": f"Get {resource_type} by key",
+            "description": f"Get a {resource_type} by its key properties {key}",
+            "operationId": f"get_{resource_type}_by_key",
+            "parameters": [
+                {"$ref": "#/components/parameters/dataset_id"},
+                *[
+                    {
+                        "name": property_name,
+                        "in": "query",
+                        "description": f"{property_name} key property",
+                        "required": True,
+                        "schema": {
+                            "type": get_property_type(properties.get(property_name, {}))
+                        },
+                    }
+                    for property_name in key
+                ],
+                *generate_openapi_expand_parameters(resource_schema),
+            ],
+            "responses": {
+                "200": {
+                    "description": f"{resource_type} found",
+                    "content": resource_content,
+                }
+            },
+        },
+        "put": {
+            "summary": f"Upsert {resource_type}",
+            "description": f"Create a {resource_type}, or update the one with the same key",
+            "operationId": f"upsert_{resource_type}",
+            "parameters": [{"$ref": "#/components/parameters/dataset_id"}],
+            "requestBody": {
+                "description": f"{resource_type} to upsert",
+                "content": resource_content,
+                "required": True,
+            },
+            "responses": {
+                "200": {
+                    "description": f"{resource_type} updated",
+                    "content": resource_content,
+                },
+                "201": {
+                    "description": f"{resource_type} created",
+                    "content": resource_content,
+                },
+            },
+        },
+    }
+
+
 def generate_openapi_schema_common_paths(url_prefix):
     """
     Generate GET, POST, PUT, DELETE for dataset resource
@@ -156,9 +542,14 @@ def generate_openapi_schema_common_paths(url_prefix):
                 "description": "List all dataset",
                 "operationId": "list_dataset",
                 "tags": ["meta"],
+                "parameters": [
+                    {"$ref": "#/components/parameters/limit"},
+                    {"$ref": "#/components/parameters/cursor"},
+                ],
                 "responses": {
                     "200": {
                         "description": "List of dataset",
+                        "headers": {"Link": {"$ref": "#/components/headers/Link"}},
                         "content": {
                             "application/json": {
                                 "schema": {
@@ -249,6 +640,87 @@ def generate_openapi_schema_common_paths(url_prefix):
                 "responses": {"204": {"description": "Dataset deleted"}},
             },
         },
+        f"/{url_prefix}/datasets/{{dataset_id}}/clone": {
+            "post": {
+                "summary": "Clone dataset",
+                "description": "Copy a dataset with all its resources",
+                "operationId": "clone_dataset",
+                "tags": ["meta"],
+                "parameters": [{"$ref": "#/components/parameters/dataset_id"}],
+                "requestBody": {
+                    "description": "Name and description of the clone",
+                    "content": {
+                        "application/json": {
+                            "schema": {"$ref": "#/components/schemas/dataset_copy"}
+                        }
+                    },
+                    "required": False,
+                },
+                "responses": {
+                    "201": {
+                        "description": "Dataset cloned",
+                        "content": {
+                            "application/json": {
+                                "schema": {"$ref": "#/components/schemas/dataset"}
+                            }
+                        },
+                    }
+                },
+            }
+        },
+        f"/{url_prefix}/datasets/{{dataset_id}}/snapshots": {
+            "get": {
+                "summary": "List snapshots",
+                "description": "List the snapshots of a dataset",
+                "operationId": "list_snapshot",
+                "tags": ["meta"],
+                "parameters": [
+                    {"$ref": "#/components/parameters/dataset_id"},
+                    {"$ref": "#/components/parameters/limit"},
+                    {"$ref": "#/components/parameters/cursor"},
+                ],
+                "responses": {
+                    "200": {
+                        "description": "List of snapshots",
+                        "headers": {"Link": {"$ref": "#/components/headers/Link"}},
+                        "content": {
+                            "application/json": {
+                                "schema": {
+                                    "type": "array",
+                                    "items": {"$ref": "#/components/schemas/dataset"},
+                                }
+                            }
+                        },
+                    }
+                },
+            },
+            "post": {
+                "summary": "Create snapshot",
+                "description": "Take a named, immutable copy of a dataset",
+                "operationId": "create_snapshot",
+                "tags": ["meta"],
+                "parameters": [{"$ref": "#/components/parameters/dataset_id"}],
+                "requestBody": {
+                    "description": "Name and description of the snapshot",
+                    "content": {
+                        "application/json": {
+                            "schema": {"$ref": "#/components/schemas/dataset_copy"}
+                        }
+                    },
+                    "required": True,
+                },
+                "responses": {
+                    "201": {
+                        "description": "Snapshot created",
+                        "content": {
+                            "application/json": {
+                                "schema": {"$ref": "#/components/schemas/dataset"}
+                            }
+                        },
+                    }
+                },
+            },
+        },
         f"/{url_prefix}/datasets/{{dataset_id}}/dump": {
             "get": {
                 "summary": "Dump dataset",
@@ -257,17 +729,216 @@ def generate_openapi_schema_common_paths(url_prefix):
                 "tags": ["meta"],
                 "parameters": [
                     {"$ref": "#/components/parameters/dataset_id"},
-                    # dump_type in query string, default to json. Can be json, xlsx
+                    # dump_type in query string, default to json. Can be json, xlsx, csv, parquet
                     {
                         "name": "type",
                         "in": "query",
                         "description": "Dump type",
                         "required": False,
-                        "schema": {"type": "string", "enum": ["json", "xlsx"], "default": "json"},
+                        "schema": {"type": "string", "enum": ["json", "xlsx", "csv", "parquet"], "default": "json"},
                     }
                 ]
+            },
+            "post": {
+                "summary": "Start a dump job",
+                "description": "Build the dump of a dataset in the background",
+                "operationId": "create_dump_job",
+                "tags": ["meta"],
+                "parameters": [
+                    {"$ref": "#/components/parameters/dataset_id"},
+                    {
+                        "name": "type",
+                        "in": "query",
+                        "description": "Dump type",
+                        "required": False,
+                        "schema": {
+                            "type": "string",
+                            "enum": ["json", "xlsx", "csv", "parquet"],
+                            "default": "json",
+                        },
+                    },
+                ],
+                "responses": {
+                    "202": {
+                        "description": "Dump job started, see the Location header",
+                        "content": {
+                            "application/json": {
+                                "schema": {"$ref": "#/components/schemas/dump_job"}
+                            }
+                        },
+                    }
+                },
+            },
+        },
+        f"/{url_prefix}/datasets/{{dataset_id}}/dump/jobs/{{job_id}}": {
+            "get": {
+                "summary": "Get dump job",
+                "description": "Get the status and progress of a dump job",
+                "operationId": "get_dump_job",
+                "tags": ["meta"],
+                "parameters": [
+                    {"$ref": "#/components/parameters/dataset_id"},
+                    {"$ref": "#/components/parameters/job_id"},
+                ],
+                "responses": {
+                    "200": {
+                        "description": "Dump job found",
+                        "content": {
+                            "application/json": {
+                                "schema": {"$ref": "#/components/schemas/dump_job"}
+                            }
+                        },
+                    },
+                    "404": {"description": "Dump job not found"},
+                },
             }
-        }
+        },
+        f"/{url_prefix}/datasets/{{dataset_id}}/dump/jobs/{{job_id}}/download": {
+            "get": {
+                "summary": "Download dump job",
+                "description": "Download the file built by a finished dump job",
+                "operationId": "download_dump_job",
+                "tags": ["meta"],
+                "parameters": [
+                    {"$ref": "#/components/parameters/dataset_id"},
+                    {"$ref": "#/components/parameters/job_id"},
+                ],
+                "responses": {
+                    "200": {"description": "Dump file"},
+                    "404": {"description": "Dump job not found"},
+                    "409": {"description": "Dump job not finished"},
+                    "410": {"description": "Dump job expired"},
+                },
+            }
+        },
+        f"/{url_prefix}/datasets/{{dataset_id}}/import": {
+            "post": {
+                "summary": "Import dataset",
+                "description": "Import the resources of an xlsx or csv zip file shaped like a dump",
+                "operationId": "import_dataset",
+                "tags": ["meta"],
+                "parameters": [
+                    {"$ref": "#/components/parameters/dataset_id"},
+                    {"$ref": "#/components/parameters/batch_size"},
+                    {
+                        "name": "type",
+                        "in": "query",
+                        "description": "Import file type",
+                        "required": False,
+                        "schema": {
+                            "type": "string",
+                            "enum": ["xlsx", "csv"],
+                            "default": "xlsx",
+                        },
+                    },
+                    {
+                        "name": "mode",
+                        "in": "query",
+                        "description": "Append to or replace the imported resource types",
+                        "required": False,
+                        "schema": {
+                            "type": "string",
+                            "enum": ["append", "replace"],
+                            "default": "append",
+                        },
+                    },
+                ],
+                "requestBody": {
+                    "description": "xlsx workbook, or zip archive of csv files",
+                    "content": {
+                        "application/octet-stream": {
+                            "schema": {"type": "string", "format": "binary"}
+                        },
+                        "multipart/form-data": {
+                            "schema": {
+                                "type": "object",
+                                "properties": {
+                                    "file": {"type": "string", "format": "binary"}
+                                },
+                            }
+                        },
+                    },
+                    "required": True,
+                },
+                "responses": {
+                    "201": {"description": "Resources imported"},
+                    "400": {"description": "Rows rejected, nothing imported"},
+                },
+            }
+        },
+        f"/{url_prefix}/datasets/{{dataset_id}}/diff": {
+            "get": {
+                "summary": "Diff dataset",
+                "description": (
+                    "Compare a dataset to a base dataset, one NDJSON line per added, "
+                    "removed or changed resource. Resources are matched by key "
+                    "(x-key), by value for the resource types without key"
+                ),
+                "operationId": "diff_dataset",
+                "tags": ["meta"],
+                "parameters": [
+                    {"$ref": "#/components/parameters/dataset_id"},
+                    {
+                        "name": "base",
+                        "in": "query",
+                        "description": "Id of the base dataset, default to the dataset source",
+                        "required": False,
+                        "schema": {"type": "integer", "format": "int64"},
+                    },
+                    {
+                        "name": "resource_type",
+                        "in": "query",
+                        "description": "Comma separated resource types to compare",
+                        "required": False,
+                        "schema": {"type": "string"},
+                    },
+                ],
+                "responses": {
+                    "200": {
+                        "description": "Differences, one json object per line",
+                        "content": {
+                            "application/x-ndjson": {
+                                "schema": {"$ref": "#/components/schemas/diff"}
+                            }
+                        },
+                    },
+                    "400": {"description": "Invalid base dataset or resource type"},
+                },
+            }
+        },
+        f"/{url_prefix}/datasets/{{dataset_id}}/changes": {
+            "get": {
+                "summary": "List dataset changes",
+                "description": "List the changes of a dataset after a sequence number",
+                "operationId": "list_change",
+                "tags": ["meta"],
+                "parameters": [
+                    {"$ref": "#/components/parameters/dataset_id"},
+                    {"$ref": "#/components/parameters/limit"},
+                    {
+                        "name": "since",
+                        "in": "query",
+                        "description": "Sequence number of the last change already seen",
+                        "required": False,
+                        "schema": {"type": "integer", "format": "int64"},
+                    },
+                ],
+                "responses": {
+                    "200": {
+                        "description": "List of changes",
+                        "headers": {"Link": {"$ref": "#/components/headers/Link"}},
+                        "content": {
+                            "application/json": {
+                                "schema": {
+                                    "type": "array",
+                                    "items": {"$ref": "#/components/schemas/change"},
+                                }
+                            }
+                        },
+                    }
+                },
+            }
+        },
     }
     return paths
 
@@ -291,6 +962,46 @@ def generate_openapi_parameters_component():
             "description": "dataset id",
             "required": True,
             "schema": {"type": "integer", "format": "int64"},
+        },
+        "batch_size": {
+            "name": "batch_size",
+            "in": "query",
+            "description": "Number of rows written per insert",
+            "required": False,
+            "schema": {"type": "integer", "minimum": 1, "default": 1000},
+        },
+        "job_id": {
+            "name": "job_id",
+            "in": "path",
+            "description": "dump job id",
+            "required": True,
+            "schema": {"type": "integer", "format": "int64"},
+        },
+        "limit": {
+            "name": "limit",
+            "in": "query",
+            "description": "Maximum number of items in the page",
+            "required": False,
+            "schema": {"type": "integer", "minimum": 1, "default": 100},
+        },
+        "cursor": {
+            "name": "cursor",
+            "in": "query",
+            "description": "Id of the last item of the previous page",
+            "required": False,
+            "schema": {"type": "integer", "format": "int64"},
+        },
+    }
+
+
+def generate_openapi_headers_component():
+    """
+    Generate openapi headers component shared by the list operations
+    """
+    return {
+        "Link": {
+            "description": 'Link to the next page (rel="next"), absent on the last page',
+            "schema": {"type": "string"},
         }
     }
 
@@ -315,7 +1026,7 @@ def generate_openapi_schema_for_app(app_id):
 
     paths.update(common_paths)
 
-    # add Dataset schema to the oas_schemas
+    # add Dataset, dump job and change feed schemas to the oas_schemas
     oas_schemas.update(
         {
             "dataset": {
@@ -325,13 +1036,74 @@ def generate_openapi_schema_for_app(app_id):
                     "id": {"type": "integer", "format": "int64"},
                     "name": {"type": "string"},
                     "description": {"type": "string"},
+                    "source": {
+                        "type": "integer",
+                        "format": "int64",
+                        "nullable": True,
+                    },
+                    "is_snapshot": {"type": "boolean"},
                 },
-            }
+            },
+            "dataset_copy": {
+                "title": "Dataset copy",
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "description": {"type": "string"},
+                },
+            },
+            "dump_job": {
+                "title": "Dump job",
+                "type": "object",
+                "properties": {
+                    "id": {"type": "integer", "format": "int64"},
+                    "dataset": {"type": "integer", "format": "int64"},
+                    "dump_type": {"type": "string"},
+                    "status": {
+                        "type": "string",
+                        "enum": ["pending", "running", "done", "failed"],
+                    },
+                    "progress": {
+                        "type": "object",
+                        "additionalProperties": {"type": "integer"},
+                    },
+                    "error": {"type": "string", "nullable": True},
+                    "created_at": {"type": "string", "format": "date-time"},
+                    "finished_at": {"type": "string", "format": "date-time"},
+                    "expires_at": {"type": "string", "format": "date-time"},
+                },
+            },
+            "change": {
+                "title": "Change",
+                "type": "object",
+                "properties": {
+                    "seq": {"type": "integer", "format": "int64"},
+                    "op": {"type": "string", "enum": ["create", "update", "delete"]},
+                    "resource_type": {"type": "string"},
+                    "resource_id": {"type": "integer", "format": "int64"},
+                    "value": {"type": "object", "nullable": True},
+                    "created_at": {"type": "string", "format": "date-time"},
+                },
+            },
+            "diff": {
+                "title": "Diff",
+                "type": "object",
+                "properties": {
+                    "op": {"type": "string", "enum": ["added", "removed", "changed"]},
+                    "resource_type": {"type": "string"},
+                    "key": {"type": "object"},
+                    "id": {"type": "integer", "format": "int64"},
+                    "value": {"type": "object"},
+                    "base_id": {"type": "integer", "format": "int64"},
+                    "base_value": {"type": "object"},
+                },
+            },
         }
     )
 
     components = {
         "parameters": generate_openapi_parameters_component(),
+        "headers": generate_openapi_headers_component(),
         "schemas": oas_schemas,
     }
     return {
@@ -341,3 +1113,35 @@ def generate_openapi_schema_for_app(app_id):
         "paths": paths,
         "components": components,
     }
+
+
+def get_openapi_etag(app):
+    """
+    Return the etag of the openapi document of an app, a hash of the app
+    schemas, name and description the document is generated from.
+    """
+    source = json.dumps([app.schemas, app.name, app.description], sort_keys=True)
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+def get_openapi_document(app_id):
+    """
+    Return the (etag, serialized json payload) of the openapi schema of an app.
+    The payload is only generated again when the app changes.
+    """
+    app = App.objects.get(id=app_id)
+    etag = get_openapi_etag(app)
+    cached = _openapi_cache.get(app.id)
+    if cached is not None and cached[0] == etag:
+        return cached
+
+    payload = json.dumps(generate_openapi_schema_for_app(app.id)).encode()
+    _openapi_cache[app.id] = (etag, payload)
+    return etag, payload
+
+
+def clear_openapi_cache(app_id):
+    """
+    Drop the cached openapi document of an app.
+    """
+    _openapi_cache.pop(app_id, None)
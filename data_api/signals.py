@@ -0,0 +1,41 @@
+from django.core.signals import request_started
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .db_utils import close_unusable_connections, configure_sqlite_connection
+from .index_utils import sync_json_indexes
+from .models import App
+from .schema_util import clear_openapi_cache
+
+
+@receiver([post_save, post_delete], sender=App)
+def sync_app_json_indexes(sender, instance, **kwargs):
+    """
+    Keep the expression indexes in line with the `x-indexed` properties.
+    """
+    sync_json_indexes()
+
+
+@receiver([post_save, post_delete], sender=App)
+def clear_app_openapi_cache(sender, instance, **kwargs):
+    """
+    Drop the cached openapi document of a changed app.
+    """
+    clear_openapi_cache(instance.id)
+
+
+@receiver(connection_created)
+def configure_connection(sender, connection, **kwargs):
+    """
+    Tune the new SQLite connections, see DATA_API_SQLITE_PRAGMAS.
+    """
+    configure_sqlite_connection(connection)
+
+
+@receiver(request_started)
+def check_connections(sender, **kwargs):
+    """
+    Drop the persistent connections that went away before the request uses them.
+    """
+    close_unusable_connections()
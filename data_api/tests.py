@@ -1,3 +1,946 @@
-from django.test import TestCase
+import csv
+import importlib.util
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent import futures
+from datetime import datetime, timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.test import (
+    Client,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.utils import timezone
+from openpyxl import Workbook
+
+from .cache_utils import SizedLocMemCache
+from .import_utils import coerce_cell
+from .ingest_utils import delete_resources
+from .job_utils import build_dump_job, purge_expired_dump_jobs
+from . import write_utils
+from .models import App, Dataset, DumpJob, Resource, ResourceChange
+from .schema_util import _openapi_cache, _validator_cache
+
+FORECAST_APP = settings.BASE_DIR / "resources" / "forecast" / "forecast_app.json"
+
+
+class DataApiMixin:
+    """
+    Create the forecast app and a dataset, with helpers to call the api.
+    """
+
+    def setUp(self):
+        # ids are reused between tests, drop what was cached for the previous ones
+        _validator_cache.clear()
+        _openapi_cache.clear()
+        caches[settings.DATA_API_DUMP_CACHE].clear()
+        with open(FORECAST_APP) as f:
+            self.app_id = self.post("/api/apps/", json.load(f)).json()["id"]
+        self.dataset_id = self.create_dataset("dataset")
+
+    def post(self, url, body):
+        return self.client.post(url, json.dumps(body), content_type="application/json")
+
+    def put(self, url, body):
+        return self.client.put(url, json.dumps(body), content_type="application/json")
+
+    def dataset_url(self, dataset_id=None):
+        if dataset_id is None:
+            dataset_id = self.dataset_id
+        return f"/api/apps/{self.app_id}/datasets/{dataset_id}"
+
+    def create_dataset(self, name):
+        response = self.post(
+            f"/api/apps/{self.app_id}/datasets/", {"name": name, "description": ""}
+        )
+        return response.json()["id"]
+
+    def create_product(self, product_id, dataset_id=None):
+        response = self.post(
+            f"{self.dataset_url(dataset_id)}/product/",
+            {"product_id": product_id, "name": f"Product {product_id}"},
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+
+class DataApiTestCase(DataApiMixin, TestCase):
+    pass
+
+
+class QueryCountTest(DataApiTestCase):
+    """
+    The list and dump endpoints run the same queries whatever the number of
+    resources.
+    """
+
+    def get_content(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        # streamed dumps run their queries while they are consumed
+        if response.streaming:
+            return b"".join(response.streaming_content)
+        return response.content
+
+    def create_products(self, count):
+        Resource.objects.bulk_create(
+            Resource(
+                dataset_id=self.dataset_id,
+                resource_type="product",
+                value={"product_id": f"p{index}", "name": "n"},
+            )
+            for index in range(count)
+        )
+        # the dumps are cached per dataset version
+        Dataset.bump_version(self.dataset_id)
+
+    def test_list(self):
+        # compile and cache the validators of the app
+        self.get_content(f"{self.dataset_url()}/product/")
+        for count in (1, 50):
+            self.create_products(count)
+            with self.subTest(count=count), self.assertNumQueries(2):
+                self.get_content(f"{self.dataset_url()}/product/")
+            with self.subTest(count=count), self.assertNumQueries(2):
+                self.get_content(f"{self.dataset_url()}/product/", {"name": "n"})
+
+    def test_dump(self):
+        # the dataset twice, then a single query for the json dump, and the
+        # resource types plus one query per resource type for the others
+        dump_queries = {"json": 3, "xlsx": 4, "csv": 4}
+        if importlib.util.find_spec("pyarrow") is not None:
+            dump_queries["parquet"] = 4
+        for count in (1, 50):
+            self.create_products(count)
+            for dump_type, queries in dump_queries.items():
+                with self.subTest(count=count, dump_type=dump_type):
+                    with self.assertNumQueries(queries):
+                        self.get_content(
+                            f"{self.dataset_url()}/dump", {"type": dump_type}
+                        )
+
+
+class PaginationTest(DataApiTestCase):
+    def setUp(self):
+        super().setUp()
+        for index in range(5):
+            self.create_product(f"p{index}")
+
+    def test_follow_next_links(self):
+        url = (
+            f"http://testserver{self.dataset_url()}/product/?limit=2&name__isnull=false"
+        )
+        product_ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            self.assertLessEqual(len(page), 2)
+            product_ids += [resource["value"]["product_id"] for resource in page]
+            link = response.get("Link")
+            if link is None:
+                break
+            self.assertTrue(link.endswith('>; rel="next"'))
+            self.assertEqual(response["X-Next-Cursor"], str(page[-1]["id"]))
+            url = link[1 : link.index(">")]
+            # the filters are kept in the next link
+            self.assertIn("name__isnull=false", url)
+        self.assertEqual(product_ids, ["p0", "p1", "p2", "p3", "p4"])
+
+    @override_settings(DATA_API_MAX_PAGE_SIZE=3)
+    def test_limit(self):
+        url = f"{self.dataset_url()}/product/"
+        self.assertEqual(len(self.client.get(url, {"limit": 100}).json()), 3)
+        for params in ({"limit": 0}, {"limit": "x"}, {"cursor": "x"}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+
+
+class FilterTest(DataApiMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        for product in (
+            {"product_id": "p1", "name": "n", "price": 1.5, "category": "a"},
+            {"product_id": "p2", "name": "n", "price": 3, "category": "b"},
+            {"product_id": "p3", "name": "n", "price": 10},
+        ):
+            self.post(f"{self.dataset_url()}/product/", product)
+
+    def get_product_ids(self, params):
+        response = self.client.get(f"{self.dataset_url()}/product/", params)
+        self.assertEqual(response.status_code, 200)
+        return [resource["value"]["product_id"] for resource in response.json()]
+
+    def test_filters(self):
+        cases = [
+            ({"category": "a"}, ["p1"]),
+            ({"price__gte": "3"}, ["p2", "p3"]),
+            ({"price__lt": "3"}, ["p1"]),
+            ({"price__in": "1.5,10"}, ["p1", "p3"]),
+            ({"category__isnull": "true"}, ["p3"]),
+            ({"category": "b", "price__lte": "3"}, ["p2"]),
+            ({"category": "c"}, []),
+        ]
+        for params, product_ids in cases:
+            with self.subTest(params=params):
+                self.assertEqual(self.get_product_ids(params), product_ids)
+
+    def test_indexed_property(self):
+        app = App.objects.get(id=self.app_id)
+        app.schemas[0]["properties"]["category"]["x-indexed"] = True
+        app.save()
+        self.assertEqual(self.get_product_ids({"category__in": "a,b"}), ["p1", "p2"])
+
+    def test_invalid_filters(self):
+        for params in (
+            {"color": "red"},
+            {"name__gt_": "n"},
+            {"price": "cheap"},
+            {"category__isnull": "maybe"},
+        ):
+            with self.subTest(params=params):
+                response = self.client.get(f"{self.dataset_url()}/product/", params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("error", response.json())
+
+
+class OpenApiTest(DataApiTestCase):
+    def test_etag(self):
+        url = f"/api/apps/{self.app_id}/schema"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+        # a changed app gets a new document and ETag
+        app = App.objects.get(id=self.app_id)
+        app.schemas[0]["properties"]["color"] = {"type": "string"}
+        app.save()
+        self.assertNotIn(self.app_id, _openapi_cache)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertIn(b'"color"', response.content)
+
+
+class ExpandTest(DataApiTestCase):
+    def setUp(self):
+        super().setUp()
+        app = App.objects.get(id=self.app_id)
+        app.schemas[1]["properties"]["product_id"]["x-ref"] = "product.product_id"
+        app.save()
+        self.products = {
+            product_id: self.create_product(product_id) for product_id in ("p1", "p2")
+        }
+        self.sales = [
+            self.post(
+                f"{self.dataset_url()}/sales/",
+                {"product_id": product_id, "quantity": 1, "date": "2021-01-01"},
+            ).json()
+            for product_id in ("p1", "p2", "p9")
+        ]
+
+    def test_list(self):
+        url = f"{self.dataset_url()}/sales/"
+        self.client.get(url)
+        # a single lookup for the referenced products of the page
+        with self.assertNumQueries(3):
+            response = self.client.get(url, {"expand": "product_id"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [sales["expanded"]["product_id"] for sales in response.json()],
+            [self.products["p1"], self.products["p2"], None],
+        )
+
+    def test_get(self):
+        response = self.client.get(
+            f"{self.dataset_url()}/sales/{self.sales[0]['id']}",
+            {"expand": "product_id"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["expanded"], {"product_id": self.products["p1"]}
+        )
+
+    def test_invalid_expand(self):
+        for resource_type, expand in (("sales", "quantity"), ("product", "product_id")):
+            with self.subTest(resource_type=resource_type):
+                response = self.client.get(
+                    f"{self.dataset_url()}/{resource_type}/", {"expand": expand}
+                )
+                self.assertEqual(response.status_code, 400)
+
+
+class SnapshotTest(DataApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_product("p1")
+        response = self.post(f"{self.dataset_url()}/snapshots", {"name": "v1"})
+        self.snapshot_id = response.json()["id"]
+        self.snapshot_product = Resource.objects.get(dataset=self.snapshot_id)
+
+    def test_snapshot_resources_cannot_be_changed(self):
+        url = f"{self.dataset_url(self.snapshot_id)}/product/{self.snapshot_product.id}"
+        response = self.put(url, {"product_id": "p1", "name": "changed"})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.client.delete(url).status_code, 409)
+
+    def test_resources_are_only_reached_through_their_dataset(self):
+        # the url of the source dataset must not lead to the snapshot resource
+        url = f"{self.dataset_url()}/product/{self.snapshot_product.id}"
+        self.assertEqual(self.client.get(url).status_code, 404)
+        response = self.put(url, {"product_id": "p1", "name": "changed"})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+        self.snapshot_product.refresh_from_db()
+        self.assertEqual(self.snapshot_product.value["name"], "Product p1")
+
+
+class DatasetVersionTest(DataApiTestCase):
+    def get_version(self):
+        return Dataset.objects.get(id=self.dataset_id).version
+
+    def test_writes_bump_the_version(self):
+        product = self.create_product("p1")
+        self.assertEqual(self.get_version(), 1)
+        url = f"{self.dataset_url()}/product/{product['id']}"
+        self.put(url, {"product_id": "p1", "name": "changed"})
+        self.assertEqual(self.get_version(), 2)
+        self.client.delete(url)
+        self.assertEqual(self.get_version(), 3)
+        self.post(
+            f"{self.dataset_url()}/product/bulk", [{"product_id": "p2", "name": "n"}]
+        )
+        self.assertEqual(self.get_version(), 4)
+
+    def test_dataset_delete_does_not_load_resources(self):
+        Resource.objects.bulk_create(
+            Resource(dataset_id=self.dataset_id, resource_type="product", value={})
+            for _ in range(50)
+        )
+        other_dataset_id = self.create_dataset("other")
+        Resource.objects.create(
+            dataset_id=other_dataset_id, resource_type="product", value={}
+        )
+        # the same queries for 50 resources as for one, no row is fetched
+        with self.assertNumQueries(6):
+            Dataset.objects.get(id=self.dataset_id).delete()
+        with self.assertNumQueries(6):
+            Dataset.objects.get(id=other_dataset_id).delete()
+
+    def test_delete_resources_in_one_statement(self):
+        for count in (1, 40):
+            Resource.objects.bulk_create(
+                Resource(dataset_id=self.dataset_id, resource_type="product", value={})
+                for _ in range(count)
+            )
+            with self.assertNumQueries(5):
+                self.assertEqual(delete_resources(self.dataset_id, ["product"]), count)
+        self.assertEqual(
+            ResourceChange.objects.filter(op=ResourceChange.DELETE).count(), 41
+        )
+
+
+class NdjsonIngestTest(DataApiTestCase):
+    def ingest(self, lines, query=""):
+        return self.client.post(
+            f"{self.dataset_url()}/product/bulk{query}",
+            "\n".join(lines),
+            content_type="application/x-ndjson",
+        )
+
+    def product_lines(self, count):
+        return [json.dumps({"product_id": f"p{i}", "name": "n"}) for i in range(count)]
+
+    def test_valid_lines_are_created(self):
+        response = self.ingest(self.product_lines(5), "?batch_size=2")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["accepted"], 5)
+        self.assertEqual(Resource.objects.count(), 5)
+
+    def test_nothing_is_created_if_a_line_is_invalid(self):
+        lines = self.product_lines(5) + ["{not json", json.dumps({"name": "n"})]
+        response = self.ingest(lines, "?batch_size=2")
+        self.assertEqual(response.status_code, 400)
+        summary = response.json()
+        self.assertEqual((summary["accepted"], summary["rejected"]), (0, 2))
+        self.assertEqual([error["line"] for error in summary["errors"]], [6, 7])
+        self.assertEqual(Resource.objects.count(), 0)
+        self.assertEqual(ResourceChange.objects.count(), 0)
+
+    def test_partial_keeps_the_valid_lines(self):
+        lines = self.product_lines(5) + ["{not json", json.dumps({"name": "n"})]
+        response = self.ingest(lines, "?batch_size=2&partial=true")
+        self.assertEqual(response.status_code, 207)
+        summary = response.json()
+        self.assertEqual((summary["accepted"], summary["rejected"]), (5, 2))
+        self.assertEqual(Resource.objects.count(), 5)
+
+
+# the key indexes are built on committed rows, PostgreSQL refuses to build
+# them in a transaction with pending foreign key checks
+class UpsertTest(DataApiMixin, TransactionTestCase):
+    def test_upsert_without_key_index(self):
+        app = App.objects.get(id=self.app_id)
+        for product_id in ("p1", "p1"):
+            self.create_product(product_id)
+        # the duplicated products keep the key index from being built
+        app.schemas[0]["x-key"] = ["product_id"]
+        url = f"{self.dataset_url()}/product/by-key"
+        with self.assertLogs("data_api.index_utils", "WARNING") as logs:
+            app.save()
+            response = self.put(url, {"product_id": "p1", "name": "n"})
+        self.assertEqual(response.status_code, 409)
+        self.assertIn("Duplicated keys, cannot create", logs.output[0])
+        # the index is built once the duplicates are removed
+        Resource.objects.filter(id=Resource.objects.order_by("id")[0].id).delete()
+        response = self.put(url, {"product_id": "p1", "name": "n"})
+        self.assertEqual(response.status_code, 200)
+
+    def test_get_by_key(self):
+        app = App.objects.get(id=self.app_id)
+        app.schemas[0]["x-key"] = ["product_id"]
+        app.save()
+        self.create_product("p1")
+        url = f"{self.dataset_url()}/product/by-key"
+        response = self.client.get(url, {"product_id": "p1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["value"]["product_id"], "p1")
+        response = self.client.get(url, {"product_id": "nope"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_key_not_declared_by_every_app(self):
+        app = App.objects.get(id=self.app_id)
+        app.schemas[0]["x-key"] = ["product_id"]
+        app.save()
+        # another app with a product resource type, without key
+        with open(FORECAST_APP) as f:
+            other_app_id = self.post("/api/apps/", json.load(f)).json()["id"]
+        other_dataset_id = self.post(
+            f"/api/apps/{other_app_id}/datasets/", {"name": "other", "description": ""}
+        ).json()["id"]
+        other_url = f"/api/apps/{other_app_id}/datasets/{other_dataset_id}/product/"
+        for _ in range(2):
+            response = self.post(other_url, {"product_id": "p1", "name": "n"})
+            self.assertEqual(response.status_code, 201)
+        # the key of the first app is not enforced either
+        response = self.put(
+            f"{self.dataset_url()}/product/by-key", {"product_id": "p1", "name": "n"}
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertIn("another app declares another key", response.json()["error"])
+
+    def test_numeric_keys(self):
+        schema = {
+            "title": "Item",
+            "type": "object",
+            "properties": {"code": {"type": "number"}, "name": {"type": "string"}},
+            "x-key": ["code"],
+        }
+        app_id = self.post(
+            "/api/apps/", {"name": "items", "description": "", "schemas": [schema]}
+        ).json()["id"]
+        dataset_id = self.post(
+            f"/api/apps/{app_id}/datasets/", {"name": "items", "description": ""}
+        ).json()["id"]
+        url = f"/api/apps/{app_id}/datasets/{dataset_id}/item/bulk"
+        response = self.put(url, [{"code": 1, "name": "a"}, {"code": 1.0, "name": "b"}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"created": 1, "updated": 0})
+        response = self.put(url, [{"code": 1.0, "name": "c"}])
+        self.assertEqual(response.json(), {"created": 0, "updated": 1})
+        self.assertEqual(
+            list(Resource.objects.filter(resource_type="item").values_list("value")),
+            [({"code": 1.0, "name": "c"},)],
+        )
+
+
+class AggregateTest(DataApiTestCase):
+    def test_filters(self):
+        for product_id, category in [("p1", "a"), ("p2", "a"), ("p3", "b")]:
+            self.post(
+                f"{self.dataset_url()}/product/",
+                {"product_id": product_id, "name": "n", "category": category},
+            )
+        response = self.client.get(
+            f"{self.dataset_url()}/product/aggregate",
+            {"group_by": "category", "name": "n", "category__in": "a"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(), [{"group": {"category": "a"}, "metrics": {"count": 2}}]
+        )
+        # the aggregation parameters are not list parameters
+        response = self.client.get(
+            f"{self.dataset_url()}/product/", {"group_by": "category"}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_filter_on_aggregation_parameter_names(self):
+        schema = {
+            "title": "Report",
+            "type": "object",
+            "properties": {"bucket": {"type": "string"}, "metrics": {"type": "string"}},
+        }
+        app_id = self.post(
+            "/api/apps/", {"name": "reports", "description": "", "schemas": [schema]}
+        ).json()["id"]
+        dataset_id = self.post(
+            f"/api/apps/{app_id}/datasets/", {"name": "reports", "description": ""}
+        ).json()["id"]
+        url = f"/api/apps/{app_id}/datasets/{dataset_id}/report/"
+        self.post(url, {"bucket": "day", "metrics": "sales"})
+        self.post(url, {"bucket": "week", "metrics": "sales"})
+        response = self.client.get(url, {"bucket": "week", "metrics": "sales"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [report["value"] for report in response.json()],
+            [{"bucket": "week", "metrics": "sales"}],
+        )
+
+
+class SizedCacheTest(SimpleTestCase):
+    def test_size_bound(self):
+        cache = SizedLocMemCache("sized-cache-test", {"OPTIONS": {"MAX_SIZE": 300}})
+        self.addCleanup(cache.clear)
+        cache.set("a", b"a" * 100)
+        cache.set("b", b"b" * 100)
+        # a was used last, b is evicted to make room for c
+        cache.get("a")
+        cache.set("c", b"c" * 100)
+        self.assertEqual((cache.get("a"), cache.get("b")), (b"a" * 100, None))
+        self.assertEqual(cache.get("c"), b"c" * 100)
+        # a value bigger than the cache is not cached, and evicts nothing
+        cache.set("d", b"d" * 300)
+        self.assertIsNone(cache.get("d"))
+        self.assertEqual(cache.get("c"), b"c" * 100)
+
+
+class ImportTest(DataApiMixin, TransactionTestCase):
+    def import_file(self, content, import_type, mode="append"):
+        return self.client.post(
+            f"{self.dataset_url()}/import?type={import_type}&mode={mode}",
+            content,
+            content_type="application/octet-stream",
+        )
+
+    def make_xlsx(self, sheets):
+        workbook = Workbook()
+        workbook.remove(workbook.active)
+        for title, rows in sheets.items():
+            sheet = workbook.create_sheet(title)
+            for row in rows:
+                sheet.append(row)
+        xlsx_file = io.BytesIO()
+        workbook.save(xlsx_file)
+        return xlsx_file.getvalue()
+
+    def make_csv_zip(self, files):
+        zip_file = io.BytesIO()
+        with zipfile.ZipFile(zip_file, "w") as archive:
+            for name, rows in files.items():
+                csv_file = io.StringIO()
+                csv.writer(csv_file).writerows(rows)
+                archive.writestr(f"{name}.csv", csv_file.getvalue())
+        return zip_file.getvalue()
+
+    def stored_values(self, resource_type):
+        return list(
+            Resource.objects.filter(resource_type=resource_type)
+            .order_by("id")
+            .values_list("value", flat=True)
+        )
+
+    def test_xlsx_cells_are_coerced(self):
+        app = App.objects.get(id=self.app_id)
+        app.schemas[1]["properties"]["date"]["format"] = "date"
+        app.save()
+        content = self.make_xlsx(
+            {
+                "product": [
+                    ["product_id", "name", "price"],
+                    [7, "n", 2.5],
+                ],
+                "sales": [
+                    ["product_id", "quantity", "date"],
+                    [7, 3, datetime(2021, 1, 2)],
+                ],
+            }
+        )
+        response = self.import_file(content, "xlsx")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["created"], 2)
+        self.assertEqual(
+            self.stored_values("product"),
+            [{"product_id": "7", "name": "n", "price": 2.5}],
+        )
+        self.assertEqual(
+            self.stored_values("sales"),
+            [{"product_id": "7", "quantity": 3, "date": "2021-01-02"}],
+        )
+        # excel may store the integers as floats
+        self.assertEqual(coerce_cell({"type": "string"}, 7.0), "7")
+        self.assertEqual(coerce_cell({"type": "integer"}, 3.0), 3)
+        self.assertEqual(coerce_cell({"type": "integer"}, 3.5), 3.5)
+
+    def test_csv_fields_are_coerced(self):
+        content = self.make_csv_zip(
+            {
+                "product": [["product_id", "name", "price"], ["007", "n", "2.5"]],
+                "sales": [["product_id", "quantity", "date"], ["007", "3", ""]],
+            }
+        )
+        response = self.import_file(content, "csv")
+        # the empty date is left out, and sales require one
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [
+                (error["resource_type"], error["row"])
+                for error in response.json()["errors"]
+            ],
+            [("sales", 2)],
+        )
+        content = self.make_csv_zip(
+            {"product": [["product_id", "name", "price"], ["007", "n", "2.5"]]}
+        )
+        self.assertEqual(self.import_file(content, "csv").status_code, 201)
+        self.assertEqual(
+            self.stored_values("product"),
+            [{"product_id": "007", "name": "n", "price": 2.5}],
+        )
+
+    def test_append_and_replace(self):
+        self.create_product("p0")
+        content = self.make_csv_zip(
+            {"product": [["product_id", "name"], ["p1", "n"], ["p2", "n"]]}
+        )
+        response = self.import_file(content, "csv")
+        self.assertEqual(
+            response.json(), {"created": 2, "deleted": 0, "rejected": 0, "errors": []}
+        )
+        response = self.import_file(content, "csv", mode="replace")
+        self.assertEqual(
+            response.json(), {"created": 2, "deleted": 3, "rejected": 0, "errors": []}
+        )
+        self.assertEqual(
+            [value["product_id"] for value in self.stored_values("product")],
+            ["p1", "p2"],
+        )
+
+    def test_rejected_row_rolls_back(self):
+        self.create_product("p0")
+        content = self.make_xlsx(
+            {
+                "product": [
+                    ["product_id", "name"],
+                    ["p1", "n"],
+                    ["p2"],
+                    [],
+                    ["p3", "n"],
+                ]
+            }
+        )
+        response = self.import_file(content, "xlsx", mode="replace")
+        self.assertEqual(response.status_code, 400)
+        summary = response.json()
+        self.assertEqual((summary["created"], summary["deleted"]), (0, 0))
+        # the rows are numbered as in the spreadsheet, the header being row 1
+        self.assertEqual(
+            [(error["resource_type"], error["row"]) for error in summary["errors"]],
+            [("product", 3)],
+        )
+        self.assertEqual(
+            [value["product_id"] for value in self.stored_values("product")], ["p0"]
+        )
+
+    def test_duplicated_keys(self):
+        app = App.objects.get(id=self.app_id)
+        app.schemas[0]["x-key"] = ["product_id"]
+        app.save()
+        self.create_product("p1")
+        content = self.make_csv_zip({"product": [["product_id", "name"], ["p1", "n"]]})
+        response = self.import_file(content, "csv")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(len(self.stored_values("product")), 1)
+
+
+class DiffTest(DataApiMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        app = App.objects.get(id=self.app_id)
+        app.schemas[0]["x-key"] = ["product_id"]
+        app.save()
+        for product_id in ("p1", "p2", "p3"):
+            self.create_product(product_id)
+        for quantity in (1, 2):
+            self.post(
+                f"{self.dataset_url()}/sales/",
+                {"product_id": "p1", "quantity": quantity, "date": "2021-01-01"},
+            )
+        self.clone_id = self.post(f"{self.dataset_url()}/clone", {}).json()["id"]
+
+    def get_resource_url(self, resource_type, **lookup):
+        resource = Resource.objects.get(
+            dataset=self.clone_id,
+            resource_type=resource_type,
+            **{f"value__{name}": value for name, value in lookup.items()},
+        )
+        return f"{self.dataset_url(self.clone_id)}/{resource_type}/{resource.id}"
+
+    def get_diff(self):
+        response = self.client.get(f"{self.dataset_url(self.clone_id)}/diff")
+        self.assertEqual(response.status_code, 200)
+        return [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+
+    def test_diff(self):
+        self.put(
+            self.get_resource_url("product", product_id="p2"),
+            {"product_id": "p2", "name": "changed"},
+        )
+        self.client.delete(self.get_resource_url("product", product_id="p3"))
+        self.create_product("p4", self.clone_id)
+        self.client.delete(self.get_resource_url("sales", quantity=2))
+        self.post(
+            f"{self.dataset_url(self.clone_id)}/sales/",
+            {"product_id": "p1", "quantity": 3, "date": "2021-01-01"},
+        )
+
+        changes = self.get_diff()
+        # keyed resources are matched by key, the others by value
+        self.assertEqual(
+            [(change["op"], change["resource_type"]) for change in changes],
+            [
+                ("added", "product"),
+                ("removed", "product"),
+                ("changed", "product"),
+                ("added", "sales"),
+                ("removed", "sales"),
+            ],
+        )
+        added, removed, changed, added_sales, removed_sales = changes
+        self.assertEqual(added["key"], {"product_id": "p4"})
+        self.assertEqual(removed["key"], {"product_id": "p3"})
+        self.assertEqual(
+            (changed["key"], changed["value"]["name"], changed["base_value"]["name"]),
+            ({"product_id": "p2"}, "changed", "Product p2"),
+        )
+        self.assertEqual(added_sales["value"]["quantity"], 3)
+        self.assertEqual(removed_sales["value"]["quantity"], 2)
+
+    def test_reordered_keys(self):
+        self.assertEqual(self.get_diff(), [])
+        self.put(
+            self.get_resource_url("product", product_id="p1"),
+            {"name": "Product p1", "product_id": "p1"},
+        )
+        changes = self.get_diff()
+        if connection.vendor == "sqlite":
+            # SQLite compares the stored json text, where the keys are reordered
+            self.assertEqual(
+                [(change["op"], change["key"]) for change in changes],
+                [("changed", {"product_id": "p1"})],
+            )
+        else:
+            self.assertEqual(changes, [])
+
+
+class DumpJobTest(DataApiTestCase):
+    def setUp(self):
+        super().setUp()
+        job_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(job_dir.cleanup)
+        settings_override = override_settings(DATA_API_DUMP_JOB_DIR=job_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.job_dir = job_dir.name
+
+    def test_failed_job_leaves_no_file(self):
+        def failing_dump(*args):
+            yield b"{"
+            raise ValueError("dump failed")
+
+        job = DumpJob.objects.create(dataset_id=self.dataset_id, dump_type="json")
+        with mock.patch("data_api.job_utils.stream_dump", failing_dump):
+            build_dump_job(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), (DumpJob.FAILED, "dump failed"))
+        self.assertIsNone(job.file_path)
+        self.assertEqual(os.listdir(self.job_dir), [])
+
+    def test_lost_jobs_are_failed_then_purged(self):
+        file_path = os.path.join(self.job_dir, "job.json")
+        open(file_path, "wb").close()
+        job = DumpJob.objects.create(
+            dataset_id=self.dataset_id,
+            dump_type="json",
+            status=DumpJob.RUNNING,
+            file_path=file_path,
+            created_at=timezone.now() - timedelta(days=1),
+        )
+        purge_expired_dump_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, DumpJob.FAILED)
+        self.assertGreater(job.expires_at, timezone.now())
+
+        DumpJob.objects.filter(id=job.id).update(expires_at=timezone.now())
+        purge_expired_dump_jobs()
+        self.assertFalse(os.path.exists(file_path))
+        self.assertIsNone(DumpJob.objects.get(id=job.id).file_path)
+
+    def test_unknown_and_expired_jobs(self):
+        jobs_url = f"{self.dataset_url()}/dump/jobs"
+        self.assertEqual(self.client.get(f"{jobs_url}/404").status_code, 404)
+        self.assertEqual(self.client.get(f"{jobs_url}/404/download").status_code, 404)
+
+        file_path = os.path.join(self.job_dir, "job.json")
+        open(file_path, "wb").close()
+        job = DumpJob.objects.create(
+            dataset_id=self.dataset_id,
+            dump_type="json",
+            status=DumpJob.DONE,
+            file_path=file_path,
+            expires_at=timezone.now(),
+        )
+        # submitting another job purges the expired one
+        with mock.patch("data_api.job_utils.get_executor"):
+            response = self.client.post(f"{self.dataset_url()}/dump?type=json")
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse(os.path.exists(file_path))
+        response = self.client.get(f"{jobs_url}/{job.id}/download")
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual(self.client.get(f"{jobs_url}/{job.id}").status_code, 200)
+
+
+@override_settings(DATA_API_COALESCE_WRITES=True, DATA_API_WRITE_TIMEOUT=0.5)
+class CoalescedWriteTest(DataApiMixin, TransactionTestCase):
+    def tearDown(self):
+        # stop the writer, its connection must not outlive the test database
+        writer = write_utils._writer
+        if writer is not None and writer.is_alive():
+            wake_up = futures.Future()
+            wake_up.cancel()
+            with mock.patch(
+                "data_api.write_utils.get_write_batch", side_effect=SystemExit
+            ):
+                write_utils._write_queue.put((None, wake_up))
+                writer.join(timeout=1)
+        super().tearDown()
+
+    def test_stalled_writer(self):
+        release = threading.Event()
+        write_batch = write_utils.write_batch
+
+        def stalled_write_batch(batch):
+            release.wait()
+            write_batch(batch)
+
+        responses = {}
+
+        def create(product_id):
+            responses[product_id] = self.post(
+                f"{self.dataset_url()}/product/",
+                {"product_id": product_id, "name": "n"},
+            )
+
+        def create_in_thread(product_id):
+            create(product_id)
+            connection.close()
+
+        with mock.patch("data_api.write_utils.write_batch", stalled_write_batch):
+            # the writer takes p1 and stalls, p2 waits in the queue
+            first = threading.Thread(target=create_in_thread, args=("p1",))
+            first.start()
+            time.sleep(0.1)
+            create("p2")
+            # p1 is answered once the writer commits it, past the timeout
+            self.assertTrue(first.is_alive())
+            release.set()
+            first.join()
+            time.sleep(0.1)
+        self.assertEqual(responses["p1"].status_code, 201)
+        # p2 was cancelled and written by its request, not again by the writer
+        self.assertEqual(responses["p2"].status_code, 201)
+        self.assertEqual(
+            sorted(Resource.objects.values_list("value__product_id", flat=True)),
+            ["p1", "p2"],
+        )
+
+    def test_dead_writer_is_restarted(self):
+        self.create_product("p1")
+        writer = write_utils._writer
+        # the writer dies on its next batch, after writing p2
+        with mock.patch(
+            "data_api.write_utils.get_write_batch", side_effect=RuntimeError
+        ), mock.patch("threading.excepthook"):
+            self.create_product("p2")
+            writer.join(timeout=1)
+        self.assertFalse(writer.is_alive())
+        self.create_product("p3")
+        self.assertTrue(write_utils._writer.is_alive())
+        self.assertEqual(Resource.objects.count(), 3)
+
+
+@skipUnless(
+    connection.vendor == "postgresql", "SQLite runs one write transaction at a time"
+)
+class ChangeFeedTest(DataApiMixin, TransactionTestCase):
+    def test_concurrent_writes_are_not_skipped(self):
+        record = ResourceChange.record.__func__
+
+        def slow_record(cls, op, resource):
+            # keep the change uncommitted for a while after taking its sequence number
+            change = record(cls, op, resource)
+            time.sleep(0.01)
+            return change
+
+        def create_products(writer):
+            client = Client()
+            for i in range(10):
+                client.post(
+                    f"{self.dataset_url()}/product/",
+                    json.dumps({"product_id": f"{writer}-{i}", "name": "n"}),
+                    content_type="application/json",
+                )
+            connection.close()
+
+        seen = []
+
+        def read_changes():
+            since = seen[-1] if seen else 0
+            changes = self.client.get(
+                f"{self.dataset_url()}/changes", {"since": since}
+            ).json()
+            seen.extend(change["seq"] for change in changes)
+
+        with mock.patch.object(ResourceChange, "record", classmethod(slow_record)):
+            writers = [
+                threading.Thread(target=create_products, args=(writer,))
+                for writer in range(4)
+            ]
+            for writer in writers:
+                writer.start()
+            # read the feed while the changes are being committed
+            while any(writer.is_alive() for writer in writers):
+                read_changes()
+            read_changes()
+        self.assertEqual(
+            seen,
+            list(ResourceChange.objects.order_by("id").values_list("id", flat=True)),
+        )
+        self.assertEqual(len(seen), 40)
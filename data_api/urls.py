@@ -8,11 +8,61 @@ urlpatterns = [
     path("apps/<int:app_id>/schema", views.openapi, name="openapi_schema"),
     path("apps/<int:app_id>/swagger", views.render_swagger, name="swagger"),
     path("apps/<int:app_id>/datasets/", views.list_dataset, name="list_dataset"),
+    path(
+        "apps/<int:app_id>/datasets/<int:dataset_id>/clone",
+        views.clone_dataset,
+        name="clone_dataset",
+    ),
+    path(
+        "apps/<int:app_id>/datasets/<int:dataset_id>/snapshots",
+        views.list_snapshot,
+        name="list_snapshot",
+    ),
+    path(
+        "apps/<int:app_id>/datasets/<int:dataset_id>/diff",
+        views.diff_dataset,
+        name="diff_dataset",
+    ),
     path(
         "apps/<int:app_id>/datasets/<int:dataset_id>/dump",
         views.dump_dataset,
         name="dump_dataset",
     ),
+    path(
+        "apps/<int:app_id>/datasets/<int:dataset_id>/dump/jobs/<int:job_id>",
+        views.get_dump_job,
+        name="get_dump_job",
+    ),
+    path(
+        "apps/<int:app_id>/datasets/<int:dataset_id>/dump/jobs/<int:job_id>/download",
+        views.download_dump_job,
+        name="download_dump_job",
+    ),
+    path(
+        "apps/<int:app_id>/datasets/<int:dataset_id>/import",
+        views.import_dataset,
+        name="import_dataset",
+    ),
+    path(
+        "apps/<int:app_id>/datasets/<int:dataset_id>/changes",
+        views.list_change,
+        name="list_change",
+    ),
+    path(
+        "apps/<int:app_id>/datasets/<int:dataset_id>/<str:resource_type>/bulk",
+        views.bulk_resource_gateway,
+        name="bulk_create_resource",
+    ),
+    path(
+        "apps/<int:app_id>/datasets/<int:dataset_id>/<str:resource_type>/aggregate",
+        views.aggregate_resource,
+        name="aggregate_resource",
+    ),
+    path(
+        "apps/<int:app_id>/datasets/<int:dataset_id>/<str:resource_type>/by-key",
+        views.resource_key_gateway,
+        name="resource_by_key",
+    ),
     path(
         "apps/<int:app_id>/datasets/<int:dataset_id>/<str:resource_type>/<int:resource_id>",
         views.resource_detail_gateway,
@@ -1,14 +1,76 @@
+import functools
+import importlib.util
 import json
+from io import BytesIO
 
 import jsonschema
-from django.http import HttpResponse, JsonResponse
-from django.shortcuts import render
-from django.urls import reverse_lazy
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render
+from django.urls import reverse, reverse_lazy
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 from django.views.decorators.http import require_http_methods
 
-from .dump_utils import dump_to_excel, dump_to_json
-from .models import App, Dataset, Resource
-from .schema_util import generate_openapi_schema_for_app
+from .aggregate_utils import (
+    aggregate_resources,
+    cache_aggregate,
+    get_aggregate_version,
+    get_cached_aggregate,
+    get_filter_query,
+    parse_aggregation,
+)
+from .diff_utils import stream_diff
+from .dump_utils import (
+    DUMP_CONTENT_TYPES,
+    DUMP_FILE_EXTENSIONS,
+    cache_dump_file,
+    dump_to_excel,
+    get_cached_dump,
+    get_dump_version,
+    stream_and_cache_dump,
+    stream_dump,
+)
+from .expand_utils import expand_resources, parse_expand
+from .filter_utils import filter_resources, parse_resource_filters
+from .import_utils import (
+    get_import_file,
+    get_import_params,
+    import_resources,
+    iter_import_file,
+)
+from .index_utils import KeyIndexMissing, get_key_properties, get_resource_key
+from .ingest_utils import (
+    NDJSON_CONTENT_TYPE,
+    bulk_create_resources,
+    get_bulk_batch_size,
+    get_key_filters,
+    get_partial,
+    get_stop_on_error,
+    parse_bulk_body,
+    stream_ingest_resources,
+    upsert_resources,
+    validate_keys,
+    validate_values,
+)
+from .job_utils import submit_dump_job
+from .json_utils import (
+    RESOURCE_ROW_FIELDS,
+    JsonResponse,
+    dumps,
+    resource_rows_to_json,
+)
+from .models import App, Dataset, DumpJob, Resource, ResourceChange
+from .pagination_utils import get_page_params, paginate_queryset, set_next_link
+from .schema_util import (
+    get_app_validators,
+    get_openapi_document,
+    get_resource_validator,
+    validate_value,
+)
+from .write_utils import coalesce_writes, queue_resource, save_resource
 
 
 def create_app(request):
@@ -29,12 +91,17 @@ def create_app(request):
 @require_http_methods(["GET", "POST"])
 def list_app(request):
     """
-    Return a list of all apps in json format.
+    Return a page of the apps in json format, see `paginate_queryset`.
     """
     if request.method == "GET":
-        apps = App.objects.all()
+        try:
+            limit, cursor = get_page_params(request)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        apps, next_cursor = paginate_queryset(App.objects.all(), limit, cursor)
         apps_json = [app.to_json() for app in apps]
-        return JsonResponse(apps_json, safe=False, status=200)
+        response = JsonResponse(apps_json, safe=False, status=200)
+        return set_next_link(request, response, next_cursor)
     elif request.method == "POST":
         return create_app(request)
 
@@ -68,75 +135,308 @@ def create_dataset(request, app_id):
 @require_http_methods(["GET", "POST"])
 def list_dataset(request, app_id):
     """
-    Return a list of all datasets in json format.
+    Return a page of the datasets in json format, see `paginate_queryset`.
     """
     if request.method == "GET":
-        datasets = Dataset.objects.filter(app=app_id)
+        try:
+            limit, cursor = get_page_params(request)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        datasets, next_cursor = paginate_queryset(
+            Dataset.objects.filter(app=app_id), limit, cursor
+        )
         datasets_json = [dataset.to_json() for dataset in datasets]
-        return JsonResponse(datasets_json, safe=False, status=200)
+        response = JsonResponse(datasets_json, safe=False, status=200)
+        return set_next_link(request, response, next_cursor)
     elif request.method == "POST":
         return create_dataset(request, app_id)
 
 
+def reject_snapshot_changes(view):
+    """
+    Answer 409 to the requests changing the resources of a snapshot, all but GETs.
+    A dataset is a snapshot from its creation on, so a single check is enough.
+    """
+
+    @functools.wraps(view)
+    def wrapper(request, app_id, dataset_id, *args, **kwargs):
+        if (
+            request.method != "GET"
+            and Dataset.objects.filter(id=dataset_id, is_snapshot=True).exists()
+        ):
+            return JsonResponse(
+                {"error": f"Dataset {dataset_id} is a snapshot, it cannot be changed"},
+                status=409,
+            )
+        return view(request, app_id, dataset_id, *args, **kwargs)
+
+    return wrapper
+
+
+@require_http_methods(["POST"])
+def clone_dataset(request, app_id, dataset_id):
+    """
+    Take an json request with the name and description of the clone and copy
+    the dataset with all its resources, see `Dataset.copy`.
+    Return the clone in json format.
+    """
+    body = json.loads(request.body) if request.body else {}
+    dataset = Dataset.objects.get(id=dataset_id, app=app_id)
+    clone = dataset.copy(
+        name=body.get("name", f"{dataset.name} (clone)"),
+        description=body.get("description", dataset.description),
+    )
+    return JsonResponse(clone.to_json(), status=201)
+
+
+def create_snapshot(request, app_id, dataset_id):
+    """
+    Take an json request with the snapshot name and description and take an
+    immutable copy of the dataset, see `Dataset.copy`.
+    Return the snapshot in json format.
+    """
+    body = json.loads(request.body)
+    if not body.get("name"):
+        return JsonResponse({"error": "Snapshots need a name"}, status=400)
+    dataset = Dataset.objects.get(id=dataset_id, app=app_id)
+    snapshot = dataset.copy(
+        name=body["name"], description=body.get("description"), snapshot=True
+    )
+    return JsonResponse(snapshot.to_json(), status=201)
+
+
+@require_http_methods(["GET", "POST"])
+def list_snapshot(request, app_id, dataset_id):
+    """
+    Return a page of the snapshots of a dataset in json format, see `paginate_queryset`.
+    """
+    if request.method == "GET":
+        try:
+            limit, cursor = get_page_params(request)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        snapshots, next_cursor = paginate_queryset(
+            Dataset.objects.filter(source=dataset_id, is_snapshot=True), limit, cursor
+        )
+        snapshots_json = [snapshot.to_json() for snapshot in snapshots]
+        response = JsonResponse(snapshots_json, safe=False, status=200)
+        return set_next_link(request, response, next_cursor)
+    elif request.method == "POST":
+        return create_snapshot(request, app_id, dataset_id)
+
+
+@require_http_methods(["GET"])
+def diff_dataset(request, app_id, dataset_id):
+    """
+    Stream the difference between a dataset and the `base` dataset as NDJSON,
+    see `stream_diff`. The base defaults to the dataset the dataset was copied
+    from, `resource_type` restricts the comparison to comma separated types.
+    """
+    dataset = Dataset.objects.get(id=dataset_id, app=app_id)
+    base_id = request.GET.get("base", dataset.source_id)
+    if base_id is None:
+        return JsonResponse(
+            {"error": f"Dataset {dataset_id} is not a copy, diff it with ?base=<id>"},
+            status=400,
+        )
+    try:
+        base = Dataset.objects.get(id=int(base_id), app=app_id)
+    except (ValueError, Dataset.DoesNotExist):
+        return JsonResponse({"error": f"Invalid base dataset {base_id}"}, status=400)
+    resource_types = [
+        resource_type
+        for resource_type in request.GET.get("resource_type", "").split(",")
+        if resource_type
+    ]
+    try:
+        for resource_type in resource_types:
+            validate_resource_type(app_id, resource_type)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    validators = get_app_validators(app_id)
+    key_properties = get_key_properties(
+        validator.schema for validator in validators.values()
+    )
+    return StreamingHttpResponse(
+        stream_diff(dataset.id, base.id, key_properties, resource_types or None),
+        content_type=NDJSON_CONTENT_TYPE,
+    )
+
+
+@require_http_methods(["GET", "POST"])
 def dump_dataset(request, app_id, dataset_id):
     """
     Return a single dataset in json format.
+    Dumps are cached per dataset version and served with an ETag and Last-Modified,
+    so an unchanged dump only costs a 304.
+
+    A POST starts a background dump job instead, see `submit_dump_job`.
     """
-    dataset = Dataset.objects.get(id=dataset_id)
+    dataset = Dataset.objects.annotate(schema_version=F("app__schema_version")).get(
+        id=dataset_id
+    )
     dump_type = request.GET.get("type", "json")
-
-    if dump_type == "json":
-        return JsonResponse(dump_to_json(dataset_id), status=200)
-    elif dump_type == "xlsx":
-        excel_bytes = dump_to_excel(dataset_id)
-        # return the excel file as an attachment
-        response = HttpResponse(
-            excel_bytes,
-            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    if dump_type not in DUMP_CONTENT_TYPES:
+        return JsonResponse({"error": f"Invalid dump type {dump_type}"}, status=400)
+    if dump_type == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        return JsonResponse({"error": "Parquet dumps require pyarrow"}, status=400)
+
+    if request.method == "POST":
+        job = submit_dump_job(dataset.id, dump_type)
+        response = JsonResponse(job.to_json(), status=202)
+        response["Location"] = reverse(
+            "get_dump_job",
+            kwargs={"app_id": app_id, "dataset_id": dataset.id, "job_id": job.id},
         )
-        response[
-            "Content-Disposition"
-        ] = f"attachment; filename=dataset_{dataset.id}.xlsx"
         return response
-    return JsonResponse({"error": f"Invalid dump type {dump_type}"}, status=400)
 
+    dump_version = get_dump_version(dataset, dump_type)
+    etag = quote_etag(dump_version)
+    last_modified = int(dataset.modified_at.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = build_dump_response(dataset, dump_type, dump_version)
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    return response
 
-def validate_resource_type(app_id, resource_type):
-    # validate if the resource type is valid
-    app = App.objects.get(id=app_id)
-    schemas = app.schemas
-    supported_resource_types = [r["title"].lower() for r in schemas]
-    if resource_type not in supported_resource_types:
-        raise Exception(
-            f"Resource type not supported. Supported resource types: {supported_resource_types}"
-        )
 
+def build_dump_response(dataset, dump_type, dump_version):
+    """
+    Return the dump of a dataset, from the dump cache if possible.
+    """
+    payload = get_cached_dump(dump_version)
+    content_type = DUMP_CONTENT_TYPES[dump_type]
+    filename = f"dataset_{dataset.id}.{DUMP_FILE_EXTENSIONS[dump_type]}"
+
+    if dump_type == "xlsx":
+        if payload is not None:
+            excel_file = BytesIO(payload)
+        else:
+            excel_file = dump_to_excel(dataset.id)
+            cache_dump_file(dump_version, excel_file)
+        # return the excel file as an attachment, the temporary file is
+        # removed once the response is closed
+        return FileResponse(
+            excel_file, as_attachment=True, filename=filename, content_type=content_type
+        )
 
-def validate_resource_value(app_id, resource_type, value):
-    # validate if the resource type is valid
-    app = App.objects.get(id=app_id)
-    schemas = app.schemas
-    resource_schema = [r for r in schemas if r["title"].lower() == resource_type][0]
-    supported_resource_types = [r["title"].lower() for r in schemas]
-    if not resource_schema:
-        raise Exception(
-            f"Resource type not supported. Supported resource types: {supported_resource_types}"
+    if payload is not None:
+        response = HttpResponse(payload, content_type=content_type)
+    else:
+        # stream the dump so memory does not grow with the dataset size
+        response = StreamingHttpResponse(
+            stream_and_cache_dump(dump_version, stream_dump(dataset.id, dump_type)),
+            content_type=content_type,
         )
+    if dump_type != "json":
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+@require_http_methods(["GET"])
+def get_dump_job(request, app_id, dataset_id, job_id):
+    """
+    Return the status and progress of a dump job in json format.
+    """
+    job = get_object_or_404(DumpJob, id=job_id, dataset=dataset_id)
+    return JsonResponse(job.to_json(), status=200)
+
+
+@require_http_methods(["GET"])
+def download_dump_job(request, app_id, dataset_id, job_id):
+    """
+    Return the file built by a dump job as an attachment.
+    """
+    job = get_object_or_404(DumpJob, id=job_id, dataset=dataset_id)
+    if job.expires_at is not None and job.expires_at <= timezone.now():
+        return JsonResponse({"error": f"Dump job {job.id} expired"}, status=410)
+    if job.status != DumpJob.DONE:
+        return JsonResponse({"error": f"Dump job {job.id} is {job.status}"}, status=409)
+    return FileResponse(
+        open(job.file_path, "rb"),
+        as_attachment=True,
+        filename=f"dataset_{job.dataset_id}.{DUMP_FILE_EXTENSIONS[job.dump_type]}",
+        content_type=DUMP_CONTENT_TYPES[job.dump_type],
+    )
+
+
+@require_http_methods(["POST"])
+@reject_snapshot_changes
+def import_dataset(request, app_id, dataset_id):
+    """
+    Take an xlsx workbook or a zip archive of csv files, shaped like the dumps,
+    and import its resources, see `import_resources`.
+    Return the number of created and deleted resources, or the errors by row.
+    """
+    dataset = Dataset.objects.get(id=dataset_id)
     try:
-        jsonschema.validate(value, resource_schema)
-    except jsonschema.exceptions.ValidationError as e:
-        raise e
+        import_type, mode = get_import_params(request)
+        batch_size = get_bulk_batch_size(request)
+        validators = get_app_validators(app_id)
+        import_file = get_import_file(request)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    try:
+        summary = import_resources(
+            iter_import_file(import_file, import_type),
+            validators,
+            dataset.id,
+            mode,
+            batch_size,
+        )
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except IntegrityError:
+        return duplicated_key_response()
+    finally:
+        import_file.close()
+    return JsonResponse(summary, status=400 if summary["rejected"] else 201)
+
+
+def duplicated_key_response(resource_type=None):
+    # a unique key index (`x-key`) rejected the write
+    subject = f"{resource_type} resources" if resource_type else "Resources"
+    return JsonResponse({"error": f"{subject} with duplicated keys"}, status=409)
+
+
+def validate_resource_type(app_id, resource_type):
+    # validate if the resource type is valid, return its compiled validator
+    return get_resource_validator(app_id, resource_type)
+
+
+def validate_resource_value(app_id, resource_type, value, validator=None):
+    # validate if the resource value is valid
+    if validator is None:
+        validator = get_resource_validator(app_id, resource_type)
+    validate_value(validator, value)
 
 
-def get_resource(request, app_id, dataset_id, resource_type, resource_id):
+def get_resource(
+    request, app_id, dataset_id, resource_type, resource_id, validator=None
+):
     """
     Return a single resource in json format.
+    The references listed in the `expand` query parameter are expanded,
+    see `expand_resources`.
     """
-    resource = Resource.objects.get(id=resource_id, resource_type=resource_type)
-    return JsonResponse(resource.to_json(), status=200)
+    if validator is None:
+        validator = get_resource_validator(app_id, resource_type)
+    try:
+        references = parse_expand(request.GET, validator.schema)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    resource = get_object_or_404(
+        Resource, id=resource_id, dataset_id=dataset_id, resource_type=resource_type
+    )
+    [resource_json] = expand_resources(
+        [resource.to_json()], resource.dataset_id, references
+    )
+    return JsonResponse(resource_json, status=200)
 
 
-def create_resource(request, app_id, dataset_id, resource_type):
+def create_resource(request, app_id, dataset_id, resource_type, validator=None):
     """
     Take an json request with the resource type and value and create a new resource.
     Return the resource in json format.
@@ -147,19 +447,27 @@ def create_resource(request, app_id, dataset_id, resource_type):
     # validate if the resource value is valid
     value = body
     try:
-        validate_resource_type(app_id, resource_type)
-        validate_resource_value(app_id, resource_type, value)
+        validate_resource_value(app_id, resource_type, value, validator)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=400)
 
     # create a new resource with the type and value from the request body
     dataset = Dataset.objects.get(id=dataset_id)
     resource = Resource(resource_type=resource_type, value=value, dataset=dataset)
-    resource.save()
+    try:
+        if coalesce_writes():
+            # inserted with the creates of the concurrent requests, see `write_utils`
+            queue_resource(resource)
+        else:
+            save_resource(resource)
+    except IntegrityError:
+        return duplicated_key_response(resource_type)
     return JsonResponse(resource.to_json(), status=201)
 
 
-def update_resource(request, app_id, dataset_id, resource_type, resource_id):
+def update_resource(
+    request, app_id, dataset_id, resource_type, resource_id, validator=None
+):
     """
     Take an json request with the resource type and value and update the resource.
     Return the resource in json format.
@@ -168,14 +476,22 @@ def update_resource(request, app_id, dataset_id, resource_type, resource_id):
     body = json.loads(request.body)
     value = body
     # update the resource with the type and value from the request body
-    resource = Resource.objects.get(id=resource_id, resource_type=resource_type)
+    resource = get_object_or_404(
+        Resource, id=resource_id, dataset_id=dataset_id, resource_type=resource_type
+    )
     resource.resource_type = resource_type
     try:
-        validate_resource_value(app_id, resource_type, value)
-    except Exception as e:
+        validate_resource_value(app_id, resource_type, value, validator)
+    except jsonschema.exceptions.ValidationError as e:
         return JsonResponse({"error": e.message}, status=400)
     resource.value = value
-    resource.save()
+    try:
+        with transaction.atomic():
+            Dataset.bump_version(dataset_id)
+            resource.save()
+            ResourceChange.record(ResourceChange.UPDATE, resource)
+    except IntegrityError:
+        return duplicated_key_response(resource_type)
     # return a resource updated response
     return JsonResponse(resource.to_json(), status=200)
 
@@ -186,64 +502,356 @@ def delete_resource(request, app_id, dataset_id, resource_type, resource_id):
     Return the resource in json format.
     """
     # delete the resource
-    resource = Resource.objects.get(id=resource_id, resource_type=resource_type)
-    resource.delete()
+    resource = get_object_or_404(
+        Resource, id=resource_id, dataset_id=dataset_id, resource_type=resource_type
+    )
+    with transaction.atomic():
+        Dataset.bump_version(dataset_id)
+        ResourceChange.record(ResourceChange.DELETE, resource)
+        resource.delete()
     # return a no content response
     return JsonResponse({}, status=204)
 
 
-def list_resource(request, app_id, dataset_id, resource_type):
+def list_resource(request, app_id, dataset_id, resource_type, validator=None):
     """
-    Return a list of all resources in json format.
+    Return a page of the resources in json format, see `paginate_queryset`.
+    The resources can be filtered on their values, see `parse_resource_filters`,
+    and their references expanded, see `expand_resources`.
     """
-    print(app_id, dataset_id, resource_type)
-    resources = Resource.objects.filter(dataset=dataset_id, resource_type=resource_type)
-    resources_json = [resource.to_json() for resource in resources]
-    return JsonResponse(resources_json, safe=False, status=200)
+    if validator is None:
+        validator = get_resource_validator(app_id, resource_type)
+    try:
+        limit, cursor = get_page_params(request)
+        filters = parse_resource_filters(request.GET, validator.schema)
+        references = parse_expand(request.GET, validator.schema)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    resources = filter_resources(
+        Resource.objects.filter(dataset=dataset_id, resource_type=resource_type),
+        filters,
+        validator.schema,
+    )
+    if references:
+        # fetch plain rows, no Resource instance is built for a list
+        rows, next_cursor = paginate_queryset(
+            resources.values(*Resource.JSON_FIELDS), limit, cursor
+        )
+        resources_json = expand_resources(
+            [Resource.row_to_json(row) for row in rows], dataset_id, references
+        )
+        response = JsonResponse(resources_json, safe=False, status=200)
+    else:
+        # nothing to expand, the values are written as stored in the database
+        rows, next_cursor = paginate_queryset(
+            resources.values_list(*RESOURCE_ROW_FIELDS), limit, cursor
+        )
+        response = HttpResponse(
+            resource_rows_to_json(rows), content_type="application/json", status=200
+        )
+    return set_next_link(request, response, next_cursor)
 
 
 @require_http_methods(["GET", "POST"])
+@reject_snapshot_changes
 def resource_gateway(request, app_id, dataset_id, resource_type):
     """
     This methods serves as the gateway to the resource methods.
     """
     # validate if the resource type is valid
     try:
-        validate_resource_type(app_id, resource_type)
+        validator = validate_resource_type(app_id, resource_type)
     except Exception as e:
-        return JsonResponse({"error": e.message}, status=400)
+        return JsonResponse({"error": str(e)}, status=400)
 
     if request.method == "GET":
-        return list_resource(request, app_id, dataset_id, resource_type)
+        return list_resource(request, app_id, dataset_id, resource_type, validator)
     elif request.method == "POST":
-        return create_resource(request, app_id, dataset_id, resource_type)
+        return create_resource(request, app_id, dataset_id, resource_type, validator)
+
+
+@require_http_methods(["POST"])
+def bulk_create_resource(request, app_id, dataset_id, resource_type):
+    """
+    Take a json array request of resource values and create them all.
+    Nothing is created if any of the values is invalid.
+    Return the number of created resources, or the errors indexed by item.
+
+    NDJSON requests are streamed instead, see `stream_ingest_resources`. They are
+    all or nothing as well, unless `partial=true` keeps the valid lines.
+    Return a summary of the accepted and rejected lines, with a 207 status when
+    only some of them were created.
+    """
+    try:
+        validator = validate_resource_type(app_id, resource_type)
+        batch_size = get_bulk_batch_size(request)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    dataset = Dataset.objects.get(id=dataset_id)
+    if request.content_type == NDJSON_CONTENT_TYPE:
+        try:
+            summary = stream_ingest_resources(
+                request,
+                validator,
+                dataset.id,
+                resource_type,
+                batch_size,
+                stop_on_error=get_stop_on_error(request),
+                partial=get_partial(request),
+            )
+        except IntegrityError:
+            return duplicated_key_response(resource_type)
+        if not summary["rejected"]:
+            return JsonResponse(summary, status=201)
+        return JsonResponse(summary, status=207 if summary["accepted"] else 400)
+
+    try:
+        values = parse_bulk_body(request)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    errors = validate_values(validator, values)
+    if errors:
+        return JsonResponse({"errors": errors}, status=400)
+
+    try:
+        created = bulk_create_resources(dataset.id, resource_type, values, batch_size)
+    except IntegrityError:
+        return duplicated_key_response(resource_type)
+    return JsonResponse({"created": created}, status=201)
+
+
+def bulk_upsert_resource(request, app_id, dataset_id, resource_type, validator):
+    """
+    Take a json array request of resource values and upsert them all by key,
+    see `upsert_resources`. Nothing is written if any of the values is invalid.
+    Return the number of created and updated resources, or the errors indexed by item.
+    """
+    key = get_resource_key(validator.schema)
+    if key is None:
+        return JsonResponse({"error": f"{resource_type} has no x-key"}, status=400)
+    try:
+        batch_size = get_bulk_batch_size(request)
+        values = parse_bulk_body(request)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    errors = validate_values(validator, values) or validate_keys(key, values)
+    if errors:
+        return JsonResponse({"errors": errors}, status=400)
+
+    dataset = Dataset.objects.get(id=dataset_id)
+    try:
+        summary = upsert_resources(dataset.id, resource_type, key, values, batch_size)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except KeyIndexMissing as e:
+        return JsonResponse({"error": str(e)}, status=409)
+    except IntegrityError:
+        return duplicated_key_response(resource_type)
+    return JsonResponse(summary, status=200)
+
+
+@require_http_methods(["POST", "PUT"])
+@reject_snapshot_changes
+def bulk_resource_gateway(request, app_id, dataset_id, resource_type):
+    """
+    This methods serves as the gateway to the bulk resource methods.
+    """
+    if request.method == "POST":
+        return bulk_create_resource(request, app_id, dataset_id, resource_type)
+
+    try:
+        validator = validate_resource_type(app_id, resource_type)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return bulk_upsert_resource(request, app_id, dataset_id, resource_type, validator)
+
+
+def get_resource_by_key(request, app_id, dataset_id, resource_type, validator):
+    """
+    Return the resource with the key given in the query string in json format,
+    `<property>=<value>` for each key property.
+    The references listed in the `expand` query parameter are expanded.
+    """
+    key = get_resource_key(validator.schema)
+    try:
+        references = parse_expand(request.GET, validator.schema)
+        filters = parse_resource_filters(request.GET, validator.schema)
+        names = sorted(name for name, operator, _ in filters if operator == "exact")
+        if len(filters) != len(key) or names != sorted(key):
+            raise ValueError(f"Query by the key properties {key}")
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    resource = get_object_or_404(
+        filter_resources(
+            Resource.objects.filter(dataset=dataset_id, resource_type=resource_type),
+            filters,
+        )
+    )
+    [resource_json] = expand_resources(
+        [resource.to_json()], resource.dataset_id, references
+    )
+    return JsonResponse(resource_json, status=200)
+
+
+def upsert_resource(request, app_id, dataset_id, resource_type, validator):
+    """
+    Take an json request with the resource value, and create it or update the
+    resource with the same key.
+    Return the resource in json format.
+    """
+    key = get_resource_key(validator.schema)
+    value = json.loads(request.body)
+    try:
+        validate_resource_value(app_id, resource_type, value, validator)
+    except jsonschema.exceptions.ValidationError as e:
+        return JsonResponse({"error": e.message}, status=400)
+    errors = validate_keys(key, [value])
+    if errors:
+        return JsonResponse({"error": errors[0]["error"]}, status=400)
+
+    dataset = Dataset.objects.get(id=dataset_id)
+    try:
+        summary = upsert_resources(dataset.id, resource_type, key, [value], 1)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except KeyIndexMissing as e:
+        return JsonResponse({"error": str(e)}, status=409)
+    except IntegrityError:
+        return duplicated_key_response(resource_type)
+    resource = filter_resources(
+        Resource.objects.filter(dataset=dataset.id, resource_type=resource_type),
+        get_key_filters(key, value),
+    ).get()
+    return JsonResponse(resource.to_json(), status=201 if summary["created"] else 200)
+
+
+@require_http_methods(["GET", "PUT"])
+@reject_snapshot_changes
+def resource_key_gateway(request, app_id, dataset_id, resource_type):
+    """
+    This methods serves as the gateway to the resource methods by key.
+    """
+    try:
+        validator = validate_resource_type(app_id, resource_type)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    if get_resource_key(validator.schema) is None:
+        return JsonResponse({"error": f"{resource_type} has no x-key"}, status=400)
+
+    if request.method == "GET":
+        return get_resource_by_key(
+            request, app_id, dataset_id, resource_type, validator
+        )
+    elif request.method == "PUT":
+        return upsert_resource(request, app_id, dataset_id, resource_type, validator)
+
+
+@require_http_methods(["GET"])
+def aggregate_resource(request, app_id, dataset_id, resource_type):
+    """
+    Return the aggregation of the resources of a type in json format, see
+    `parse_aggregation`. The resources can be filtered first, see
+    `parse_resource_filters`.
+    Aggregations are cached per dataset version and served with an ETag and
+    Last-Modified, like the dumps.
+    """
+    try:
+        validator = validate_resource_type(app_id, resource_type)
+        filters = parse_resource_filters(
+            get_filter_query(request.GET), validator.schema
+        )
+        group_by, metrics, buckets = parse_aggregation(request.GET, validator.schema)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    dataset = Dataset.objects.annotate(schema_version=F("app__schema_version")).get(
+        id=dataset_id
+    )
+    aggregate_version = get_aggregate_version(dataset, resource_type, request.GET)
+    etag = quote_etag(aggregate_version)
+    last_modified = int(dataset.modified_at.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        payload = get_cached_aggregate(aggregate_version)
+        if payload is None:
+            resources = filter_resources(
+                Resource.objects.filter(
+                    dataset=dataset.id, resource_type=resource_type
+                ),
+                filters,
+                validator.schema,
+            )
+            try:
+                results = aggregate_resources(
+                    resources, validator.schema, group_by, metrics, buckets
+                )
+            except ValueError as e:
+                return JsonResponse({"error": str(e)}, status=400)
+            payload = dumps(results)
+            cache_aggregate(aggregate_version, payload)
+        response = HttpResponse(payload, content_type="application/json", status=200)
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    return response
 
 
 @require_http_methods(["GET", "PUT", "DELETE"])
+@reject_snapshot_changes
 def resource_detail_gateway(request, app_id, dataset_id, resource_type, resource_id):
     """
     This methods serves as the gateway to the resource detail methods.
     """
     try:
-        validate_resource_type(app_id, resource_type)
+        validator = validate_resource_type(app_id, resource_type)
     except Exception as e:
-        return JsonResponse({"error": e.message}, status=400)
+        return JsonResponse({"error": str(e)}, status=400)
 
     if request.method == "GET":
-        return get_resource(request, app_id, dataset_id, resource_type, resource_id)
+        return get_resource(
+            request, app_id, dataset_id, resource_type, resource_id, validator
+        )
     elif request.method == "PUT":
-        return update_resource(request, app_id, dataset_id, resource_type, resource_id)
+        return update_resource(
+            request, app_id, dataset_id, resource_type, resource_id, validator
+        )
     elif request.method == "DELETE":
         return delete_resource(request, app_id, dataset_id, resource_type, resource_id)
 
 
+@require_http_methods(["GET"])
+def list_change(request, app_id, dataset_id):
+    """
+    Return a page of the change feed of a dataset in json format, the changes
+    with a sequence number above the `since` query parameter.
+    """
+    try:
+        limit, since = get_page_params(request, cursor_parameter="since")
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    changes, next_since = paginate_queryset(
+        ResourceChange.objects.filter(dataset=dataset_id), limit, since
+    )
+    changes_json = [change.to_json() for change in changes]
+    response = JsonResponse(changes_json, safe=False, status=200)
+    return set_next_link(request, response, next_since, cursor_parameter="since")
+
+
 @require_http_methods(["GET"])
 def openapi(request, app_id):
     """
     Return the openapi schema.
+    The schema is cached and served with an ETag, so unchanged schemas only cost a 304.
     """
-    openapi_schema = generate_openapi_schema_for_app(app_id)
-    return JsonResponse(openapi_schema, status=200)
+    etag, payload = get_openapi_document(app_id)
+    etag = quote_etag(etag)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(payload, content_type="application/json", status=200)
+    response["ETag"] = etag
+    return response
 
 
 def render_swagger(request, app_id):
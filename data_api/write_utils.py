@@ -0,0 +1,179 @@
+import queue
+import threading
+import time
+from concurrent import futures
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+
+from .models import Dataset, Resource, ResourceChange
+
+# resources waiting for the writer thread, with the future of their request
+_write_queue = queue.Queue()
+# the writer thread is started on the first queued resource
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def coalesce_writes():
+    """
+    Return whether single resource creates go through the writer thread, see
+    DATA_API_COALESCE_WRITES. Writes inside a transaction never do, the writer
+    could not see the rows of the transaction nor take the write lock it holds.
+    """
+    return getattr(settings, "DATA_API_COALESCE_WRITES", False) and (
+        not connection.in_atomic_block
+    )
+
+
+def start_writer():
+    # started on the first queued resource, and again if it died
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(
+                target=run_writer, name="resource-writer", daemon=True
+            )
+            _writer.start()
+
+
+def save_resource(resource):
+    """
+    Insert a single resource and record it in the change feed, in its own
+    transaction.
+    """
+    with transaction.atomic():
+        Dataset.bump_version(resource.dataset_id)
+        resource.save()
+        ResourceChange.record(ResourceChange.CREATE, resource)
+    return resource
+
+
+def queue_resource(resource):
+    """
+    Queue the creation of a resource and wait for the writer thread to insert it.
+    Return the resource with its id, raise the error of its insert, e.g. an
+    IntegrityError on a duplicated key.
+    If the writer does not take the resource within DATA_API_WRITE_TIMEOUT
+    seconds, e.g. stalled on a lock, the resource is inserted directly instead.
+    Once taken, the resource is waited for until the writer resolves it, as the
+    writer may still commit it.
+    """
+    future = futures.Future()
+    _write_queue.put((resource, future))
+    start_writer()
+    try:
+        return future.result(timeout=getattr(settings, "DATA_API_WRITE_TIMEOUT", 10))
+    except futures.TimeoutError:
+        # a cancelled resource is skipped by the writer
+        if future.cancel():
+            return save_resource(resource)
+        return future.result()
+
+
+def get_write_batch():
+    """
+    Return the next batch of queued resources: wait for the first one, then take
+    the ones queued within DATA_API_WRITE_BATCH_WAIT milliseconds, up to
+    DATA_API_WRITE_BATCH_SIZE. The resources queued while a batch is written are
+    taken at once, so batches grow with the load.
+    """
+    batch_size = getattr(settings, "DATA_API_WRITE_BATCH_SIZE", 500)
+    deadline = (
+        time.monotonic() + getattr(settings, "DATA_API_WRITE_BATCH_WAIT", 2) / 1000
+    )
+    batch = [_write_queue.get()]
+    while len(batch) < batch_size:
+        try:
+            batch.append(_write_queue.get(timeout=max(deadline - time.monotonic(), 0)))
+        except queue.Empty:
+            break
+    return batch
+
+
+def run_writer():
+    """
+    Insert the queued resources batch after batch. Runs in the writer thread,
+    with its own database connection, closed if the thread dies.
+    """
+    try:
+        while True:
+            batch = [
+                (resource, future)
+                for resource, future in get_write_batch()
+                # skip the resources whose request stopped waiting
+                if future.set_running_or_notify_cancel()
+            ]
+            if not batch:
+                continue
+            try:
+                write_batch(batch)
+            except BaseException as e:
+                # the requests of the batch wait until their future is resolved
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                if not isinstance(e, Exception):
+                    raise
+                # start again from a new connection
+                connection.close()
+    finally:
+        connection.close()
+
+
+def write_batch(batch):
+    """
+    Insert a batch of queued resources in one transaction and resolve their futures.
+    If the batch fails on a duplicated key, the resources are inserted again one
+    by one, so only the offending ones fail.
+    """
+    resources = [resource for resource, _ in batch]
+    try:
+        with transaction.atomic():
+            insert_batch(resources)
+    except Exception as e:
+        if len(batch) == 1:
+            batch[0][1].set_exception(e)
+            return
+        for resource, future in batch:
+            resource.id = None
+            try:
+                with transaction.atomic():
+                    insert_batch([resource])
+            except Exception as error:
+                future.set_exception(error)
+            else:
+                future.set_result(resource)
+        return
+    for resource, future in batch:
+        future.set_result(resource)
+
+
+def insert_batch(resources):
+    """
+    Insert resources of any datasets with a single bulk_create, set their ids and
+    record them in the change feed. Must run inside a transaction.
+    """
+    dataset_ids = sorted({resource.dataset_id for resource in resources})
+    # bumping the versions first takes the write lock before the last resource
+    # id is read
+    for dataset_id in dataset_ids:
+        Dataset.bump_version(dataset_id)
+    last_id = Resource.objects.aggregate(last_id=Max("id"))["last_id"]
+    Resource.objects.bulk_create(resources)
+    if not connection.features.can_return_rows_from_bulk_insert:
+        # the write lock is held, the rows above last_id are the ones just inserted
+        resource_ids = (
+            Resource.objects.filter(id__gt=last_id or 0)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        for resource, resource_id in zip(resources, resource_ids):
+            resource.id = resource_id
+    for dataset_id in dataset_ids:
+        ResourceChange.record_bulk_create(
+            dataset_id,
+            [resource for resource in resources if resource.dataset_id == dataset_id],
+            last_id,
+        )